@@ -1,1699 +1,2334 @@
-import os
-
-# Keep your Windows Cloudinary workaround (harmless in prod; can disable via env if desired)
-os.environ["HTTPX_DISABLE_HTTP2"] = os.getenv("HTTPX_DISABLE_HTTP2", "1")
-
-import uuid
-import logging
-import math
-import time
-import smtplib
-from email.message import EmailMessage
-from datetime import datetime, timezone, timedelta
-from functools import wraps  # ✅ NEW
-
-from flask import (
-    Flask,
-    render_template,
-    request,
-    redirect,
-    url_for,
-    flash,
-    session,
-    abort,
-)
-from pymongo import MongoClient
-from bson.objectid import ObjectId
-from bson.errors import InvalidId
-from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
-import requests
-
-from authlib.integrations.flask_client import OAuth
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.exceptions import RequestEntityTooLarge
-
-# --------------------------------------------------------
-# Logging (production-friendly)
-# --------------------------------------------------------
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(level=LOG_LEVEL)
-logger = logging.getLogger(__name__)
-
-# --------------------------------------------------------
-# Load .env variables
-# --------------------------------------------------------
-load_dotenv()
-
-MONGO_URI = os.getenv("MONGO_URI")
-
-CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
-CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
-CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
-
-SUPABASE_URL = os.getenv("SUPABASE_URL") or "https://cepabjmlengczyiezdqd.supabase.co"
-SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET") or "streetwalk"
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-
-# ---------------- MapTiler config ----------------
-MAPTILER_KEY = os.getenv("MAPTILER_KEY")
-MAP_STYLE_URL = (
-    f"https://api.maptiler.com/maps/streets-v2/style.json?key={MAPTILER_KEY}"
-    if MAPTILER_KEY
-    else ""
-)
-
-# --------------------------------------------------------
-# Production toggles
-# --------------------------------------------------------
-ENV = os.getenv("FLASK_ENV", "").lower() or os.getenv("ENV", "").lower() or "production"
-IS_PROD = ENV == "production"
-
-# --------------------------------------------------------
-# Upload limits (HARD server cap)
-# --------------------------------------------------------
-MAX_REQUEST_MB = int(os.getenv("MAX_REQUEST_MB", "120"))
-MAX_CONTENT_LENGTH = MAX_REQUEST_MB * 1024 * 1024
-
-# Per-file limits
-MAX_VIDEO_SIZE = int(os.getenv("MAX_VIDEO_SIZE_MB", "100")) * 1024 * 1024  # default 100MB
-MAX_GLB_SIZE = int(os.getenv("MAX_GLB_SIZE_MB", "50")) * 1024 * 1024      # default 50MB
-MAX_THUMB_SIZE = int(os.getenv("MAX_THUMB_SIZE_MB", "5")) * 1024 * 1024  # default 5MB
-ALLOWED_THUMB_EXT = {"jpg", "jpeg", "png", "webp"}
-
-
-# --------------------------------------------------------
-# Cloudinary Config
-# --------------------------------------------------------
-cloudinary.config(
-    cloud_name=CLOUDINARY_CLOUD_NAME,
-    api_key=CLOUDINARY_API_KEY,
-    api_secret=CLOUDINARY_API_SECRET,
-    secure=True,
-    timeout=int(os.getenv("CLOUDINARY_TIMEOUT", "180")),
-)
-
-# --------------------------------------------------------
-# Flask App
-# --------------------------------------------------------
-app = Flask(__name__)
-app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
-
-# Cookies hardened for production
-app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.urandom(32)
-app.config.update(
-    SESSION_COOKIE_HTTPONLY=True,
-    SESSION_COOKIE_SAMESITE=os.getenv("SESSION_COOKIE_SAMESITE", "Lax"),
-)
-
-# If you're behind HTTPS (Render/Cloudflare), set this true in prod:
-if os.getenv("SESSION_COOKIE_SECURE", "1" if IS_PROD else "0") == "1":
-    app.config["SESSION_COOKIE_SECURE"] = True
-
-# If you use reverse proxy (Render, Nginx), set this so url_for(_external=True) uses https:
-PREFERRED_URL_SCHEME = os.getenv("PREFERRED_URL_SCHEME")
-if PREFERRED_URL_SCHEME:
-    app.config["PREFERRED_URL_SCHEME"] = PREFERRED_URL_SCHEME
-
-# expose map style to templates
-app.config["MAP_STYLE_URL"] = MAP_STYLE_URL
-
-# --------------------------------------------------------
-# OAuth (Google)
-# --------------------------------------------------------
-oauth = OAuth(app)
-if GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET:
-    oauth.register(
-        name="google",
-        client_id=GOOGLE_CLIENT_ID,
-        client_secret=GOOGLE_CLIENT_SECRET,
-        server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-        client_kwargs={"scope": "openid email profile"},
-    )
-else:
-    logger.warning("Google OAuth client ID/secret not set; Google login disabled.")
-
-# --------------------------------------------------------
-# MongoDB Setup
-# --------------------------------------------------------
-if not MONGO_URI:
-    raise RuntimeError("MONGO_URI is not set")
-
-client = MongoClient(MONGO_URI)
-db = client["streetwalk"]
-streets_collection = db["streets"]
-users_collection = db["users"]
-reset_tokens = db["password_resets"]
-activity_logs = db["activity_logs"]
-geocode_cache = db["geocode_cache"]  # cache Nominatim responses
-
-# --------------------------------------------------------
-# MongoDB Indexes
-# --------------------------------------------------------
-streets_collection.create_index([("type", 1), ("mode", 1)])
-streets_collection.create_index([("createdAt", -1)])
-streets_collection.create_index([("likes", -1)])
-streets_collection.create_index([("lat", 1), ("lng", 1)])
-streets_collection.create_index([("ownerId", 1), ("deleted", 1)])
-
-users_collection.create_index("email", unique=True)
-users_collection.create_index("googleId", unique=True, sparse=True)
-
-reset_tokens.create_index("token", unique=True)
-reset_tokens.create_index("expiresAt", expireAfterSeconds=0)
-
-activity_logs.create_index([("userId", 1), ("timestamp", -1)])
-
-geocode_cache.create_index("q", unique=True)
-geocode_cache.create_index("expiresAt", expireAfterSeconds=0)
-
-# --------------------------------------------------------
-# Helpers
-# --------------------------------------------------------
-def clean_text(value, max_len=200):
-    if not value:
-        return None
-    return value.strip()[:max_len]
-
-
-def make_json_safe(obj):
-    if obj is None:
-        return None
-
-    if isinstance(obj, ObjectId):
-        return str(obj)
-
-    if isinstance(obj, dict):
-        out = {}
-        for k, v in obj.items():
-            if isinstance(v, ObjectId):
-                out[k] = str(v)
-            elif isinstance(v, (dict, list)):
-                out[k] = make_json_safe(v)
-            else:
-                out[k] = v
-        return out
-
-    if isinstance(obj, list):
-        return [make_json_safe(x) for x in obj]
-
-    return obj
-
-
-def list_with_str_id(cursor):
-    return [make_json_safe(s) for s in list(cursor)]
-
-
-def published_not_deleted(extra=None):
-    base = {"status": "published", "deleted": False}
-    if extra:
-        base.update(extra)
-    return base
-
-
-def distinct_categories_for_mode(mode: str):
-    cats = streets_collection.distinct(
-        "category",
-        {"type": "video", "mode": mode, "status": "published", "deleted": False},
-    )
-    cats = [c for c in cats if c]
-    return sorted(cats)
-def allowed_thumb(filename: str) -> bool:
-    if not filename:
-        return False
-    ext = filename.rsplit(".", 1)[-1].lower()
-    return ext in ALLOWED_THUMB_EXT
-
-
-
-def format_date(dt):
-    if not dt:
-        return ""
-    if isinstance(dt, datetime):
-        return dt.astimezone(timezone.utc).strftime("%d %b %Y")
-    return ""
-
-
-def to_iso(dt):
-    if not dt:
-        return None
-    if isinstance(dt, datetime):
-        # always return UTC ISO
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt.astimezone(timezone.utc).isoformat()
-    return None
-
-
-def start_date_for_range(days: int):
-    # days=0 -> all time
-    if not days or days <= 0:
-        return None
-    return datetime.utcnow() - timedelta(days=days)
-
-
-def current_user():
-    uid = session.get("user_id")
-    if not uid:
-        return None
-    try:
-        oid = ObjectId(uid)
-        user = users_collection.find_one({"_id": oid})
-        if user:
-            user["_id"] = str(user["_id"])
-        return user
-    except InvalidId:
-        return None
-
-
-def is_admin_user(user) -> bool:
-    """
-    Production-safe admin check.
-    Use DB field 'role' == 'admin' instead of a session flag.
-    """
-    if not user:
-        return False
-    return user.get("role") == "admin"
-
-
-# ✅ admin guard decorator
-def admin_required(fn):
-    @wraps(fn)
-    def wrapper(*args, **kwargs):
-        user = current_user()
-        if not user:
-            session["next"] = request.path
-            return redirect(url_for("login"))
-        if not is_admin_user(user):
-            abort(403)
-        return fn(*args, **kwargs)
-    return wrapper
-
-
-def upload_glb_supabase(file):
-    if not SUPABASE_SERVICE_KEY:
-        raise RuntimeError("SUPABASE_SERVICE_KEY not set")
-
-    filename = f"models/{uuid.uuid4()}.glb"
-    upload_url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{filename}"
-
-    headers = {
-        "apikey": SUPABASE_SERVICE_KEY,
-        "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-        "Content-Type": "model/gltf-binary",
-    }
-
-    res = requests.post(upload_url, headers=headers, data=file.read(), timeout=30)
-
-    if res.status_code in (200, 201):
-        return f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{filename}"
-    logger.error("Supabase upload failed: %s", res.text)
-    raise Exception(f"Supabase Upload Failed: {res.text}")
-
-
-def upload_video_cloudinary(file):
-    try:
-        upload = cloudinary.uploader.upload(
-            file,
-            folder="streetwalk_videos",
-            resource_type="video",
-            timeout=int(os.getenv("CLOUDINARY_TIMEOUT", "180")),
-        )
-        return upload["secure_url"]
-    except Exception:
-        logger.error("Cloudinary video upload failed", exc_info=True)
-        raise
-
-def upload_image_cloudinary(file):
-    try:
-        upload = cloudinary.uploader.upload(
-            file,
-            folder="streetwalk_thumbs",
-            resource_type="image",
-            timeout=int(os.getenv("CLOUDINARY_TIMEOUT", "180")),
-        )
-        return upload["secure_url"]
-    except Exception:
-        logger.error("Cloudinary thumbnail upload failed", exc_info=True)
-        raise
-
-def get_street_by_id(street_id):
-    if not street_id:
-        return None
-    try:
-        oid = ObjectId(street_id)
-    except InvalidId:
-        return None
-    doc = streets_collection.find_one({"_id": oid})
-    if not doc:
-        return None
-    return make_json_safe(doc)
-
-
-# ---------------- Email sender (Password reset) ----------------
-SMTP_HOST = os.getenv("SMTP_HOST")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USER = os.getenv("SMTP_USER")
-SMTP_PASS = os.getenv("SMTP_PASS")
-SMTP_FROM = os.getenv("SMTP_FROM")  # e.g. "ABTO <no-reply@yourdomain.com>"
-APP_BASE_URL = os.getenv("APP_BASE_URL")  # e.g. "https://abto.yourdomain.com"
-
-
-def send_email(to_email: str, subject: str, body_text: str):
-    if not (SMTP_HOST and SMTP_USER and SMTP_PASS and SMTP_FROM):
-        logger.error("Email is not configured (SMTP_* missing).")
-        raise RuntimeError("Email service not configured")
-
-    msg = EmailMessage()
-    msg["From"] = SMTP_FROM
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg.set_content(body_text)
-
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=15) as s:
-        s.starttls()
-        s.login(SMTP_USER, SMTP_PASS)
-        s.send_message(msg)
-
-
-# ---------------- Nominatim: caching + backoff ----------------
-def _cache_key_for_query(query: str) -> str:
-    return query.strip().lower()
-
-
-def geocode_place(query: str):
-    if not query:
-        return None
-
-    q = _cache_key_for_query(query)
-
-    cached = geocode_cache.find_one({"q": q})
-    if cached and ("data" in cached):
-        return cached["data"]
-
-    base_url = os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org/search")
-    params = {"q": query, "format": "json", "limit": 1}
-
-    headers = {
-        "User-Agent": os.getenv(
-            "NOMINATIM_USER_AGENT",
-            "ABTO/1.0 (contact: support@yourdomain.com)",
-        )
-    }
-
-    max_attempts = int(os.getenv("NOMINATIM_MAX_ATTEMPTS", "4"))
-    base_sleep = float(os.getenv("NOMINATIM_BASE_SLEEP", "0.6"))
-    timeout = float(os.getenv("NOMINATIM_TIMEOUT", "10"))
-
-    last_exc = None
-    for attempt in range(1, max_attempts + 1):
-        try:
-            res = requests.get(base_url, params=params, headers=headers, timeout=timeout)
-
-            if res.status_code in (429, 500, 502, 503, 504):
-                sleep_s = base_sleep * (2 ** (attempt - 1))
-                logger.warning(
-                    "Nominatim %s attempt %s/%s. Sleeping %.2fs",
-                    res.status_code, attempt, max_attempts, sleep_s
-                )
-                time.sleep(sleep_s)
-                continue
-
-            res.raise_for_status()
-
-            results = res.json() if res.text else []
-            if not results:
-                geocode_cache.update_one(
-                    {"q": q},
-                    {"$set": {"q": q, "data": None, "expiresAt": datetime.utcnow() + timedelta(hours=6)}},
-                    upsert=True,
-                )
-                return None
-
-            r = results[0]
-            lat = float(r["lat"])
-            lon = float(r["lon"])
-            data = {"lat": lat, "lng": lon, "display_name": r.get("display_name", query)}
-
-            geocode_cache.update_one(
-                {"q": q},
-                {"$set": {"q": q, "data": data, "expiresAt": datetime.utcnow() + timedelta(days=30)}},
-                upsert=True,
-            )
-            return data
-
-        except Exception as exc:
-            last_exc = exc
-            sleep_s = base_sleep * (2 ** (attempt - 1))
-            logger.warning(
-                "Nominatim error attempt %s/%s: %s. Sleeping %.2fs",
-                attempt, max_attempts, exc, sleep_s
-            )
-            time.sleep(sleep_s)
-
-    if last_exc:
-        raise last_exc
-    return None
-
-
-def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371.0
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    d_phi = math.radians(lat2 - lat1)
-    d_lambda = math.radians(lon2 - lon1)
-    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
-
-def estimate_price_aed(distance_km: float) -> dict:
-    if distance_km <= 0:
-        approx = 400.0
-    else:
-        base = 200.0
-        if distance_km <= 2000:
-            variable = distance_km * 0.45
-        else:
-            variable = 2000 * 0.45 + (distance_km - 2000) * 0.35
-        approx = base + variable
-
-    low = round(approx * 0.8 / 10) * 10
-    high = round(approx * 1.2 / 10) * 10
-    mid = round(approx / 10) * 10
-    return {"currency": "AED", "low": float(low), "high": float(high), "mid": float(mid)}
-
-
-def build_price_texts(distance_km: float, price_info: dict):
-    distance_text = f"Distance: approx. {distance_km:,.1f} km (great-circle estimate)."
-    currency = price_info.get("currency", "AED")
-    low = price_info.get("low", 0.0)
-    high = price_info.get("high", 0.0)
-    mid = price_info.get("mid", 0.0)
-    price_text = (
-        f"Estimated one-way economy flight budget: "
-        f"{currency} {low:,.0f} – {currency} {high:,.0f} "
-        f"(typical ~ {currency} {mid:,.0f} per person)."
-    )
-    return distance_text, price_text
-
-
-@app.context_processor
-def inject_current_user():
-    return {"current_user": current_user()}
-
-
-# --------------------------------------------------------
-# Error handling: large uploads (MAX_CONTENT_LENGTH)
-# --------------------------------------------------------
-@app.errorhandler(RequestEntityTooLarge)
-def handle_large_upload(e):
-    flash(f"Upload too large. Max request size is {MAX_REQUEST_MB}MB.", "error")
-    ref = request.referrer or url_for("upload")
-    return redirect(ref)
-
-
-# --------------------------------------------------------
-# Route protection for upload & dashboard
-# --------------------------------------------------------
-@app.before_request
-def protect_protected_routes():
-    public_endpoints = (
-        None,
-        "static",
-        "index",
-        "world",
-        "world_walk",
-        "world_drive",
-        "world_fly",
-        "world_sit",
-        "walk",
-        "drive",
-        "fly",
-        "sit",
-        "how_it_works",  # ✅ NEW: public page
-        "login",
-        "signup",
-        "forgot_password",
-        "reset_password",
-        "login_google",
-        "auth_google_callback",
-        "logout",
-        "api_price",
-        "like_street",
-        # ✅ allow admin pages to be protected by decorator (not here)
-    )
-
-    if request.endpoint in public_endpoints:
-        return
-
-    protected = {"upload", "dashboard", "edit_street", "delete_street", "log_activity"}
-    if request.endpoint in protected and not session.get("user_id"):
-        session["next"] = request.path
-        return redirect(url_for("login"))
-
-
-# --------------------------------------------------------
-# Home Page
-# --------------------------------------------------------
-@app.route("/")
-def index():
-    streets = list_with_str_id(streets_collection.find(published_not_deleted()))
-
-    tour_cursor = streets_collection.find(
-        published_not_deleted({"type": "video", "is_tour": True})
-    ).sort("createdAt", -1).limit(8)
-    tour_streets = list_with_str_id(tour_cursor)
-
-    return render_template(
-        "index.html",
-        streets=streets,
-        tour_streets=tour_streets,
-        map_style_url=MAP_STYLE_URL,
-    )
-
-
-# --------------------------------------------------------
-# ✅ NEW: How ABTO Works (separate page)
-# --------------------------------------------------------
-@app.route("/how-it-works")
-def how_it_works():
-    return render_template("how_it_works.html")
-
-
-# --------------------------------------------------------
-# Generic World Page
-# --------------------------------------------------------
-@app.route("/world")
-def world():
-    street_id = request.args.get("street_id")
-    streets = list_with_str_id(streets_collection.find(published_not_deleted()))
-
-    center = {"lat": 25.2048, "lng": 55.2708}
-    if streets:
-        try:
-            center = {"lat": streets[0]["lat"], "lng": streets[0]["lng"]}
-        except KeyError:
-            pass
-
-    selected_street = None
-    street_error = None
-
-    if street_id:
-        raw_doc = get_street_by_id(street_id)
-        if not raw_doc:
-            street_error = "not_found"
-        elif raw_doc.get("status") != "published" or raw_doc.get("deleted", False):
-            street_error = "unavailable"
-        else:
-            selected_street = raw_doc
-
-    if selected_street:
-        mode = selected_street.get("mode", "walk")
-        template_map = {
-            "walk": "world.html",
-            "drive": "drive_world.html",
-            "fly": "fly_world.html",
-            "sit": "sit_world.html",
-        }
-        template = template_map.get(mode, "world.html")
-
-        mode_streets = list_with_str_id(
-            streets_collection.find(published_not_deleted({"mode": mode}))
-        )
-
-        if mode_streets:
-            try:
-                center = {"lat": mode_streets[0]["lat"], "lng": mode_streets[0]["lng"]}
-            except KeyError:
-                pass
-
-        return render_template(
-            template,
-            streets=mode_streets,
-            center=center,
-            selected_street=selected_street,
-            street_error=street_error,
-            mode=mode,
-            map_style_url=MAP_STYLE_URL,
-        )
-
-    return render_template(
-        "world.html",
-        streets=streets,
-        center=center,
-        selected_street=None,
-        street_error=street_error,
-        map_style_url=MAP_STYLE_URL,
-    )
-
-
-# --------------------------------------------------------
-# WALK world
-# --------------------------------------------------------
-@app.route("/world/walk")
-def world_walk():
-    streets = list_with_str_id(
-        streets_collection.find(
-            published_not_deleted({"$or": [{"type": "3d"}, {"type": "video", "mode": "walk"}]})
-        )
-    )
-
-    center = {"lat": 25.2048, "lng": 55.2708}
-    if streets:
-        try:
-            center = {"lat": streets[0]["lat"], "lng": streets[0]["lng"]}
-        except KeyError:
-            pass
-
-    street_id = request.args.get("street_id")
-    selected_street = None
-    street_error = None
-
-    if street_id:
-        candidate = get_street_by_id(street_id)
-        if not candidate:
-            street_error = "not_found"
-        else:
-            is_ok = (
-                candidate.get("status") == "published"
-                and not candidate.get("deleted", False)
-                and (
-                    candidate.get("type") == "3d"
-                    or (candidate.get("type") == "video" and candidate.get("mode") == "walk")
-                )
-            )
-            if is_ok:
-                selected_street = candidate
-            else:
-                street_error = "unavailable"
-
-    return render_template(
-        "world.html",
-        streets=streets,
-        center=center,
-        selected_street=selected_street,
-        street_error=street_error,
-        map_style_url=MAP_STYLE_URL,
-    )
-
-
-# --------------------------------------------------------
-# DRIVE world
-# --------------------------------------------------------
-@app.route("/world/drive")
-def world_drive():
-    streets = list_with_str_id(
-        streets_collection.find(published_not_deleted({"type": "video", "mode": "drive"}))
-    )
-
-    center = {"lat": 25.2048, "lng": 55.2708}
-    if streets:
-        try:
-            center = {"lat": streets[0]["lat"], "lng": streets[0]["lng"]}
-        except KeyError:
-            pass
-
-    street_id = request.args.get("street_id")
-    selected_street = None
-    street_error = None
-
-    if street_id:
-        candidate = get_street_by_id(street_id)
-        if not candidate:
-            street_error = "not_found"
-        else:
-            is_ok = (
-                candidate.get("status") == "published"
-                and not candidate.get("deleted", False)
-                and candidate.get("type") == "video"
-                and candidate.get("mode") == "drive"
-            )
-            if is_ok:
-                selected_street = candidate
-            else:
-                street_error = "unavailable"
-
-    return render_template(
-        "drive_world.html",
-        streets=streets,
-        center=center,
-        selected_street=selected_street,
-        street_error=street_error,
-        map_style_url=MAP_STYLE_URL,
-    )
-
-
-# --------------------------------------------------------
-# FLY world
-# --------------------------------------------------------
-@app.route("/world/fly")
-def world_fly():
-    streets = list_with_str_id(
-        streets_collection.find(published_not_deleted({"type": "video", "mode": "fly"}))
-    )
-
-    center = {"lat": 25.2048, "lng": 55.2708}
-    if streets:
-        try:
-            center = {"lat": streets[0]["lat"], "lng": streets[0]["lng"]}
-        except KeyError:
-            pass
-
-    street_id = request.args.get("street_id")
-    selected_street = None
-    street_error = None
-
-    if street_id:
-        candidate = get_street_by_id(street_id)
-        if not candidate:
-            street_error = "not_found"
-        else:
-            is_ok = (
-                candidate.get("status") == "published"
-                and not candidate.get("deleted", False)
-                and candidate.get("type") == "video"
-                and candidate.get("mode") == "fly"
-            )
-            if is_ok:
-                selected_street = candidate
-            else:
-                street_error = "unavailable"
-
-    return render_template(
-        "fly_world.html",
-        streets=streets,
-        center=center,
-        selected_street=selected_street,
-        street_error=street_error,
-        map_style_url=MAP_STYLE_URL,
-    )
-
-
-# --------------------------------------------------------
-# SIT world
-# --------------------------------------------------------
-@app.route("/world/sit")
-def world_sit():
-    streets = list_with_str_id(
-        streets_collection.find(published_not_deleted({"type": "video", "mode": "sit"}))
-    )
-
-    center = {"lat": 25.2048, "lng": 55.2708}
-    if streets:
-        try:
-            center = {"lat": streets[0]["lat"], "lng": streets[0]["lng"]}
-        except KeyError:
-            pass
-
-    street_id = request.args.get("street_id")
-    selected_street = None
-    street_error = None
-
-    if street_id:
-        candidate = get_street_by_id(street_id)
-        if not candidate:
-            street_error = "not_found"
-        else:
-            is_ok = (
-                candidate.get("status") == "published"
-                and not candidate.get("deleted", False)
-                and candidate.get("type") == "video"
-                and candidate.get("mode") == "sit"
-            )
-            if is_ok:
-                selected_street = candidate
-            else:
-                street_error = "unavailable"
-
-    return render_template(
-        "sit_world.html",
-        streets=streets,
-        center=center,
-        selected_street=selected_street,
-        street_error=street_error,
-        map_style_url=MAP_STYLE_URL,
-    )
-
-
-# --------------------------------------------------------
-# LIST PAGES
-# --------------------------------------------------------
-@app.route("/walk")
-def walk():
-    category = request.args.get("category", "").strip() or None
-    query = published_not_deleted({"type": "video", "mode": "walk"})
-    if category and category.lower() != "all":
-        query["category"] = category
-    walk_streets = list_with_str_id(streets_collection.find(query))
-    categories = distinct_categories_for_mode("walk")
-    return render_template("walk.html", streets=walk_streets, categories=categories, active_category=category or "all")
-
-
-@app.route("/drive")
-def drive():
-    category = request.args.get("category", "").strip() or None
-    query = published_not_deleted({"type": "video", "mode": "drive"})
-    if category and category.lower() != "all":
-        query["category"] = category
-    drive_streets = list_with_str_id(streets_collection.find(query))
-    categories = distinct_categories_for_mode("drive")
-    return render_template("drive.html", streets=drive_streets, categories=categories, active_category=category or "all")
-
-
-@app.route("/fly")
-def fly():
-    category = request.args.get("category", "").strip() or None
-    query = published_not_deleted({"type": "video", "mode": "fly"})
-    if category and category.lower() != "all":
-        query["category"] = category
-    fly_streets = list_with_str_id(streets_collection.find(query))
-    categories = distinct_categories_for_mode("fly")
-    return render_template("fly.html", streets=fly_streets, categories=categories, active_category=category or "all")
-
-
-@app.route("/sit")
-def sit():
-    category = request.args.get("category", "").strip() or None
-    query = published_not_deleted({"type": "video", "mode": "sit"})
-    if category and category.lower() != "all":
-        query["category"] = category
-    sit_streets = list_with_str_id(streets_collection.find(query))
-    categories = distinct_categories_for_mode("sit")
-    return render_template("sit.html", streets=sit_streets, categories=categories, active_category=category or "all")
-
-
-# --------------------------------------------------------
-# Signup
-# --------------------------------------------------------
-@app.route("/signup", methods=["GET", "POST"])
-def signup():
-    if request.method == "POST":
-        email = request.form["email"].strip().lower()
-        name = request.form["name"].strip()
-        password = request.form["password"]
-
-        if users_collection.find_one({"email": email}):
-            flash("Email already registered", "error")
-            return redirect(url_for("signup"))
-
-        users_collection.insert_one(
-            {
-                "email": email,
-                "name": name,
-                "passwordHash": generate_password_hash(password),
-                "createdAt": datetime.utcnow(),
-                "lastLoginAt": None,
-                "role": "user",
-            }
-        )
-        flash("Account created. Please log in.", "success")
-        return redirect(url_for("login"))
-
-    return render_template("signup.html")
-
-
-# --------------------------------------------------------
-# Email/password Login
-# --------------------------------------------------------
-@app.route("/login", methods=["GET", "POST"])
-def login():
-    if request.method == "POST":
-        email = request.form["email"].strip().lower()
-        password = request.form["password"]
-
-        user = users_collection.find_one({"email": email})
-        if not user or not user.get("passwordHash"):
-            flash("Invalid email or password", "error")
-            return redirect(url_for("login"))
-
-        if not check_password_hash(user["passwordHash"], password):
-            flash("Invalid email or password", "error")
-            return redirect(url_for("login"))
-
-        users_collection.update_one({"_id": user["_id"]}, {"$set": {"lastLoginAt": datetime.utcnow()}})
-
-        session["user_id"] = str(user["_id"])
-        session["user_name"] = user.get("name", user.get("email", "User"))
-
-        next_url = session.pop("next", None) or url_for("index")
-        return redirect(next_url)
-
-    return render_template("login.html")
-
-
-# --------------------------------------------------------
-# Logout
-# --------------------------------------------------------
-@app.route("/logout")
-def logout():
-    session.clear()
-    flash("You have been signed out.", "info")
-    return redirect(url_for("index"))
-
-
-# --------------------------------------------------------
-# Google Login
-# --------------------------------------------------------
-@app.route("/login/google")
-def login_google():
-    if "google" not in oauth._registry:
-        flash("Google login is not configured.", "error")
-        return redirect(url_for("login"))
-
-    next_url = request.args.get("next") or session.get("next") or url_for("index")
-    session["next"] = next_url
-
-    redirect_uri = url_for("auth_google_callback", _external=True)
-    return oauth.google.authorize_redirect(redirect_uri)
-
-
-@app.route("/auth/google/callback")
-def auth_google_callback():
-    if "google" not in oauth._registry:
-        flash("Google login is not configured.", "error")
-        return redirect(url_for("login"))
-
-    oauth.google.authorize_access_token()
-    userinfo = oauth.google.userinfo()
-
-    google_id = userinfo.get("sub")
-    email = (userinfo.get("email") or "").lower()
-    name = userinfo.get("name") or ""
-    now = datetime.utcnow()
-
-    user = users_collection.find_one({"googleId": google_id})
-    if not user and email:
-        user = users_collection.find_one({"email": email})
-
-    if user:
-        users_collection.update_one(
-            {"_id": user["_id"]},
-            {"$set": {"googleId": google_id, "email": email, "name": name, "lastLoginAt": now}},
-        )
-    else:
-        users_collection.insert_one(
-            {"googleId": google_id, "email": email, "name": name, "createdAt": now, "lastLoginAt": now, "role": "user"}
-        )
-        user = users_collection.find_one({"googleId": google_id})
-
-    session["user_id"] = str(user["_id"])
-    session["user_name"] = user.get("name", user.get("email", "User"))
-    session["google_user"] = {"id": google_id, "email": email, "name": name}
-
-    next_url = session.pop("next", None)
-    return redirect(next_url or url_for("index"))
-
-
-# --------------------------------------------------------
-# Forgot / Reset Password (PRODUCTION READY)
-# --------------------------------------------------------
-@app.route("/forgot-password", methods=["GET", "POST"])
-def forgot_password():
-    if request.method == "POST":
-        email = request.form["email"].strip().lower()
-        user = users_collection.find_one({"email": email})
-
-        flash("If that email exists, a reset link has been sent.", "info")
-
-        if user:
-            token = uuid.uuid4().hex
-            reset_tokens.insert_one(
-                {"userId": user["_id"], "token": token, "expiresAt": datetime.utcnow() + timedelta(hours=1), "createdAt": datetime.utcnow()}
-            )
-
-            if not APP_BASE_URL:
-                reset_link = url_for("reset_password", token=token, _external=True)
-            else:
-                reset_link = f"{APP_BASE_URL.rstrip('/')}{url_for('reset_password', token=token)}"
-
-            try:
-                send_email(
-                    to_email=email,
-                    subject="Reset your ABTO password",
-                    body_text=(
-                        "We received a request to reset your password.\n\n"
-                        f"Reset link (valid for 1 hour):\n{reset_link}\n\n"
-                        "If you did not request this, you can ignore this email."
-                    ),
-                )
-            except Exception as e:
-                logger.error("Password reset email failed: %s", e)
-
-        return redirect(url_for("login"))
-
-    return render_template("forgot_password.html")
-
-
-@app.route("/reset-password/<token>", methods=["GET", "POST"])
-def reset_password(token):
-    rec = reset_tokens.find_one({"token": token})
-    if not rec or rec.get("expiresAt") < datetime.utcnow():
-        flash("Reset link is invalid or expired.", "error")
-        return redirect(url_for("login"))
-
-    if request.method == "POST":
-        new_pw = request.form["password"]
-
-        users_collection.update_one({"_id": rec["userId"]}, {"$set": {"passwordHash": generate_password_hash(new_pw)}})
-        reset_tokens.delete_one({"_id": rec["_id"]})
-
-        flash("Password updated. You can log in now.", "success")
-        return redirect(url_for("login"))
-
-    return render_template("reset_password.html")
-
-
-# --------------------------------------------------------
-# Upload Route (CREATE with ownerId) - size hardened
-# --------------------------------------------------------
-@app.route("/upload", methods=["GET", "POST"])
-def upload():
-    user = current_user()
-    if not user:
-        session["next"] = request.path
-        return redirect(url_for("login"))
-
-    owner_oid = ObjectId(user["_id"])
-
-    if request.method == "POST":
-        street_type = request.form.get("street_type")
-
-        mode = request.form.get("mode")
-        name = clean_text(request.form.get("name"), 100)
-        city = clean_text(request.form.get("city"), 50)
-        country = clean_text(request.form.get("country"), 50)
-
-        try:
-            lat = float(request.form.get("lat"))
-            lng = float(request.form.get("lng"))
-        except Exception:
-            flash("Invalid latitude/longitude", "error")
-            return redirect(url_for("upload"))
-
-        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
-            flash("Latitude/longitude out of range", "error")
-            return redirect(url_for("upload"))
-
-        category = clean_text(request.form.get("category"), 80)
-        description = clean_text(request.form.get("description"), 500)
-
-        # ---------------- VIDEO ----------------
-        if street_type == "video":
-            if mode not in ["walk", "drive", "fly", "sit"]:
-                mode = "walk"
-
-            is_tour_flag = request.form.get("is_tour")
-            is_tour = True if is_tour_flag in ("on", "true", "1") else False
-            tour_category = clean_text(request.form.get("tour_category"), 80)
-            tour_best_time = clean_text(request.form.get("tour_best_time"), 80)
-
-            # ✅ NEW: Thumbnail (optional)
-            thumbnail_url = None
-            thumb_file = request.files.get("thumbnail")
-            if thumb_file and thumb_file.filename:
-                if not allowed_thumb(thumb_file.filename):
-                    flash("Thumbnail must be JPG / PNG / WEBP.", "error")
-                    return redirect(url_for("upload"))
-
-                thumb_file.seek(0, os.SEEK_END)
-                thumb_size = thumb_file.tell()
-                thumb_file.seek(0)
-
-                if thumb_size > MAX_THUMB_SIZE:
-                    flash(f"Thumbnail must be under {MAX_THUMB_SIZE // (1024*1024)}MB", "error")
-                    return redirect(url_for("upload"))
-
-                try:
-                    thumbnail_url = upload_image_cloudinary(thumb_file)
-                except Exception as e:
-                    flash("Thumbnail upload failed.", "error")
-                    logger.error("Thumbnail upload failed: %s", e)
-                    return redirect(url_for("upload"))
-
-            files = request.files.getlist("video")
-            links_raw = request.form.get("video_links")
-
-            video_urls = []
-
-            if files:
-                for file in files:
-                    if file and file.filename:
-                        file.seek(0, os.SEEK_END)
-                        size = file.tell()
-                        file.seek(0)
-
-                        if size > MAX_VIDEO_SIZE:
-                            flash(f"Each video must be under {MAX_VIDEO_SIZE // (1024*1024)}MB", "error")
-                            return redirect(url_for("upload"))
-
-                        try:
-                            url = upload_video_cloudinary(file)
-                            video_urls.append(url)
-                        except Exception as e:
-                            flash("Video upload failed.", "error")
-                            logger.error("Video upload failed: %s", e)
-                            return redirect(url_for("upload"))
-
-            if links_raw:
-                links = [link.strip() for link in links_raw.replace("\n", ",").split(",")]
-                video_urls.extend([link for link in links if link])
-
-            if not video_urls:
-                flash("Upload one or more videos or paste links!", "error")
-                return redirect(url_for("upload"))
-
-            street_doc = {
-                "ownerId": owner_oid,
-                "type": "video",
-                "mode": mode,
-                "category": category,
-                "name": name,
-                "city": city,
-                "country": country,
-                "lat": lat,
-                "lng": lng,
-                "description": description,
-                "videos": [{"url": url, "title": f"Part {i + 1}"} for i, url in enumerate(video_urls)],
-                "thumbnail_url": thumbnail_url,  # ✅ NEW FIELD
-                "likes": 0,
-                "createdAt": datetime.utcnow(),
-                "updatedAt": datetime.utcnow(),
-                "status": "published",
-                "deleted": False,
-                "is_tour": is_tour,
-                "tour_category": tour_category,
-                "tour_best_time": tour_best_time,
-            }
-
-        # ---------------- 3D ----------------
-        elif street_type == "3d":
-            file = request.files.get("model")
-            link = request.form.get("model_link")
-
-            glb_url = None
-
-            if file and file.filename:
-                file.seek(0, os.SEEK_END)
-                size = file.tell()
-                file.seek(0)
-
-                if size > MAX_GLB_SIZE:
-                    flash(f"GLB file must be under {MAX_GLB_SIZE // (1024*1024)}MB", "error")
-                    return redirect(url_for("upload"))
-
-                try:
-                    glb_url = upload_glb_supabase(file)
-                except Exception as e:
-                    flash("GLB upload failed.", "error")
-                    logger.error("GLB upload failed: %s", e)
-                    return redirect(url_for("upload"))
-
-            elif link:
-                glb_url = link.strip()
-            else:
-                flash("Upload a GLB or paste a model URL", "error")
-                return redirect(url_for("upload"))
-
-            street_doc = {
-                "ownerId": owner_oid,
-                "type": "3d",
-                "name": name,
-                "city": city,
-                "country": country,
-                "description": description,
-                "lat": lat,
-                "lng": lng,
-                "glbUrl": glb_url,
-                "likes": 0,
-                "createdAt": datetime.utcnow(),
-                "updatedAt": datetime.utcnow(),
-                "status": "published",
-                "deleted": False,
-            }
-
-        else:
-            flash("Invalid street type!", "error")
-            return redirect(url_for("upload"))
-
-        streets_collection.insert_one(street_doc)
-        flash("Street added successfully!", "success")
-        return redirect(url_for("dashboard"))
-
-    return render_template("upload.html")
-
-
-
-# --------------------------------------------------------
-# Dashboard Page (READ only your streets by default)
-# --------------------------------------------------------
-@app.route("/dashboard")
-def dashboard():
-    user = current_user()
-    if not user:
-        session["next"] = request.path
-        return redirect(url_for("login"))
-
-    query = {"deleted": False}
-    if not is_admin_user(user):
-        query["ownerId"] = ObjectId(user["_id"])
-
-    streets = list_with_str_id(streets_collection.find(query))
-
-    for s in streets:
-        s["createdAtFmt"] = format_date(s.get("createdAt"))
-
-    total_streets = len(streets)
-    total_likes = sum(int(s.get("likes", 0) or 0) for s in streets)
-    walk_count = sum(1 for s in streets if s.get("type") == "video" and s.get("mode") == "walk")
-    drive_count = sum(1 for s in streets if s.get("type") == "video" and s.get("mode") == "drive")
-    fly_count = sum(1 for s in streets if s.get("type") == "video" and s.get("mode") == "fly")
-    sit_count = sum(1 for s in streets if s.get("type") == "video" and s.get("mode") == "sit")
-
-    recent_streets = sorted(streets, key=lambda s: s.get("createdAt") or datetime.min, reverse=True)[:8]
-
-    user_info = {
-        "name": user.get("name") or user.get("email", "User"),
-        "email": user.get("email", ""),
-        "createdAtFmt": format_date(user.get("createdAt")),
-        "lastLoginFmt": format_date(user.get("lastLoginAt")),
-        "role": user.get("role", "user"),
-        "is_admin": bool(is_admin_user(user)),
-    }
-
-    return render_template(
-        "dash.html",
-        streets=streets,
-        total_streets=total_streets,
-        total_likes=total_likes,
-        walk_count=walk_count,
-        drive_count=drive_count,
-        fly_count=fly_count,
-        sit_count=sit_count,
-        recent_streets=recent_streets,
-        map_style_url=MAP_STYLE_URL,
-        user_info=user_info,
-    )
-
-
-# --------------------------------------------------------
-# ✅ ADMIN PAGES
-# --------------------------------------------------------
-@app.route("/admin")
-@admin_required
-def admin_dashboard():
-    total_users = users_collection.count_documents({})
-    total_streets = streets_collection.count_documents({"deleted": False})
-    total_deleted = streets_collection.count_documents({"deleted": True})
-
-    recent_logs = list(activity_logs.find({}).sort("timestamp", -1).limit(25))
-    recent_logs = make_json_safe(recent_logs)
-
-    return render_template(
-        "admin/dashboard.html",
-        total_users=total_users,
-        total_streets=total_streets,
-        total_deleted=total_deleted,
-        recent_logs=recent_logs,
-    )
-
-
-@app.route("/admin/users")
-@admin_required
-def admin_users():
-    users = list(users_collection.find({}).sort("createdAt", -1).limit(200))
-    users = make_json_safe(users)
-    return render_template("admin/users.html", users=users)
-
-
-@app.route("/admin/streets")
-@admin_required
-def admin_streets():
-    streets = list(streets_collection.find({}).sort("createdAt", -1).limit(300))
-    streets = make_json_safe(streets)
-    return render_template("admin/streets.html", streets=streets)
-
-
-@app.post("/admin/user/<user_id>/make-admin")
-@admin_required
-def admin_make_user_admin(user_id):
-    try:
-        oid = ObjectId(user_id)
-    except InvalidId:
-        abort(404)
-
-    users_collection.update_one({"_id": oid}, {"$set": {"role": "admin"}})
-    flash("User promoted to admin.", "success")
-    return redirect(url_for("admin_users"))
-
-
-@app.post("/admin/user/<user_id>/make-user")
-@admin_required
-def admin_make_admin_user_normal(user_id):
-    try:
-        oid = ObjectId(user_id)
-    except InvalidId:
-        abort(404)
-
-    users_collection.update_one({"_id": oid}, {"$set": {"role": "user"}})
-    flash("Admin changed to user.", "info")
-    return redirect(url_for("admin_users"))
-
-
-# --------------------------------------------------------
-# Edit Street (UPDATE – only owner or admin)
-# --------------------------------------------------------
-@app.route("/street/<street_id>/edit", methods=["GET", "POST"])
-def edit_street(street_id):
-    user = current_user()
-    if not user:
-        session["next"] = request.path
-        return redirect(url_for("login"))
-
-    try:
-        oid = ObjectId(street_id)
-    except InvalidId:
-        abort(404)
-
-    query = {"_id": oid, "deleted": False}
-    if not is_admin_user(user):
-        query["ownerId"] = ObjectId(user["_id"])
-
-    street = streets_collection.find_one(query)
-    if not street:
-        abort(404)
-
-    if request.method == "POST":
-        updated_fields = {
-            "name": clean_text(request.form.get("name"), 100),
-            "city": clean_text(request.form.get("city"), 50),
-            "country": clean_text(request.form.get("country"), 50),
-            "category": clean_text(request.form.get("category"), 80),
-            "description": clean_text(request.form.get("description"), 500),
-        }
-
-        if "is_tour" in request.form:
-            is_tour_flag = request.form.get("is_tour")
-            updated_fields["is_tour"] = True if is_tour_flag in ("on", "true", "1") else False
-        if "tour_category" in request.form:
-            updated_fields["tour_category"] = clean_text(request.form.get("tour_category"), 80)
-        if "tour_best_time" in request.form:
-            updated_fields["tour_best_time"] = clean_text(request.form.get("tour_best_time"), 80)
-
-        try:
-            lat = float(request.form.get("lat"))
-            lng = float(request.form.get("lng"))
-            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
-                raise ValueError
-            updated_fields["lat"] = lat
-            updated_fields["lng"] = lng
-        except Exception:
-            flash("Invalid latitude/longitude", "error")
-            return redirect(url_for("edit_street", street_id=street_id))
-
-        updated_fields["updatedAt"] = datetime.utcnow()
-        streets_collection.update_one({"_id": oid}, {"$set": updated_fields})
-        flash("Street updated successfully.", "success")
-        return redirect(url_for("dashboard"))
-
-    street["_id"] = str(street["_id"])
-    return render_template("edit_street.html", street=street)
-
-
-# --------------------------------------------------------
-# Delete Street (DELETE – only owner or admin, soft delete)
-# --------------------------------------------------------
-@app.route("/street/<street_id>/delete", methods=["POST"])
-def delete_street(street_id):
-    user = current_user()
-    if not user:
-        session["next"] = request.path
-        return redirect(url_for("login"))
-
-    try:
-        oid = ObjectId(street_id)
-    except InvalidId:
-        abort(404)
-
-    query = {"_id": oid, "deleted": False}
-    if not is_admin_user(user):
-        query["ownerId"] = ObjectId(user["_id"])
-
-    result = streets_collection.update_one(
-        query,
-        {"$set": {"deleted": True, "deletedAt": datetime.utcnow(), "updatedAt": datetime.utcnow()}}
-    )
-
-    if result.matched_count == 0:
-        abort(404)
-
-    flash("Street deleted.", "info")
-    return redirect(url_for("dashboard"))
-
-
-# --------------------------------------------------------
-# Trip Price API  (/api/price)
-# --------------------------------------------------------
-@app.route("/api/price", methods=["POST"])
-def api_price():
-    payload = request.get_json(silent=True) or {}
-
-    origin = clean_text(payload.get("origin") or payload.get("from"), 100)
-    destination = clean_text(payload.get("destination") or payload.get("to"), 100)
-
-    if not origin or not destination:
-        return {"error": "Please enter both origin and destination."}, 400
-
-    try:
-        geo_from = geocode_place(origin)
-        geo_to = geocode_place(destination)
-    except Exception:
-        logger.exception("api_price: geocoding failed")
-        return {"error": "Could not reach the distance service. Please try again in a moment."}, 502
-
-    if not geo_from or not geo_to:
-        return {"error": "We couldn't find one of those places. Try using a nearby big city or airport."}, 404
-
-    distance_km = haversine_km(geo_from["lat"], geo_from["lng"], geo_to["lat"], geo_to["lng"])
-
-    price_info = estimate_price_aed(distance_km)
-    distance_text, price_text = build_price_texts(distance_km, price_info)
-
-    return {
-        "origin_formatted": geo_from.get("display_name", origin),
-        "destination_formatted": geo_to.get("display_name", destination),
-        "distance_km": round(distance_km, 1),
-        "distance_text": distance_text,
-        "price_text": price_text,
-    }
-
-
-# --------------------------------------------------------
-# Activity Logging API
-# --------------------------------------------------------
-@app.route("/api/activity", methods=["POST"])
-def log_activity():
-    user = current_user()
-    if not user:
-        return ("", 204)
-
-    data = request.get_json(silent=True) or {}
-    event_type = clean_text(data.get("event_type"), 50)
-    street_id = data.get("street_id")
-    mode = clean_text(data.get("mode"), 10)
-    extra = data.get("extra") if isinstance(data.get("extra"), dict) else {}
-
-    try:
-        street_oid = ObjectId(street_id) if street_id else None
-    except InvalidId:
-        street_oid = None
-
-    log_doc = {
-        "userId": ObjectId(user["_id"]),
-        "streetId": street_oid,
-        "eventType": event_type,
-        "mode": mode,
-        "timestamp": datetime.utcnow(),
-        "userAgent": request.headers.get("User-Agent", "")[:200],
-        "extra": extra,
-    }
-    activity_logs.insert_one(log_doc)
-    return ("", 204)
-
-
-@app.get("/api/dashboard/summary")
-def api_dashboard_summary():
-    user = current_user()
-    if not user:
-        return {"error": "Unauthorized"}, 401
-
-    days = int(request.args.get("days", "30"))
-    since = start_date_for_range(days)
-
-    query_streets = {"deleted": False}
-    if not is_admin_user(user):
-        query_streets["ownerId"] = ObjectId(user["_id"])
-
-    streets = list(streets_collection.find(query_streets, {
-        "name": 1, "city": 1, "country": 1, "type": 1, "mode": 1, "likes": 1,
-        "createdAt": 1, "lat": 1, "lng": 1, "status": 1
-    }))
-
-    def is_video_mode(doc, m):
-        return doc.get("type") == "video" and doc.get("mode") == m
-
-    totals = {
-        "total_streets": len(streets),
-        "total_likes": sum(int(s.get("likes", 0) or 0) for s in streets),
-        "walk_count": sum(1 for s in streets if is_video_mode(s, "walk")),
-        "drive_count": sum(1 for s in streets if is_video_mode(s, "drive")),
-        "fly_count": sum(1 for s in streets if is_video_mode(s, "fly")),
-        "sit_count": sum(1 for s in streets if is_video_mode(s, "sit")),
-        "is_admin": bool(is_admin_user(user)),
-    }
-
-    logs_query = {}
-    if not is_admin_user(user):
-        logs_query["userId"] = ObjectId(user["_id"])
-    if since:
-        logs_query["timestamp"] = {"$gte": since}
-
-    events = list(activity_logs.find(logs_query, {
-        "eventType": 1, "streetId": 1, "mode": 1, "timestamp": 1
-    }).sort("timestamp", -1).limit(500))
-
-    view_types = set(["view_world", "open_world", "view_street", "open_street"])
-    def is_view_event(e):
-        et = (e.get("eventType") or "").lower()
-        return et in view_types or et.startswith("view") or et.startswith("open")
-
-    day_counts = {}
-    for e in events:
-        if not is_view_event(e):
-            continue
-        ts = e.get("timestamp")
-        if not ts:
-            continue
-        day = ts.strftime("%Y-%m-%d")
-        day_counts[day] = day_counts.get(day, 0) + 1
-
-    street_map = {}
-    streets_safe = []
-    for s in streets:
-        sid = str(s["_id"])
-        street_map[sid] = s
-        streets_safe.append({
-            "_id": sid,
-            "name": s.get("name") or "Untitled",
-            "city": s.get("city") or "",
-            "country": s.get("country") or "",
-            "type": s.get("type"),
-            "mode": s.get("mode"),
-            "likes": int(s.get("likes", 0) or 0),
-            "createdAt": to_iso(s.get("createdAt")),
-            "lat": s.get("lat"),
-            "lng": s.get("lng"),
-            "status": s.get("status", ""),
-        })
-
-    view_by_street = {}
-    for e in events:
-        if not is_view_event(e):
-            continue
-        sid = e.get("streetId")
-        if not sid:
-            continue
-        key = str(sid)
-        view_by_street[key] = view_by_street.get(key, 0) + 1
-
-    top_views = sorted(view_by_street.items(), key=lambda x: x[1], reverse=True)[:8]
-    top_views_list = []
-    for sid, c in top_views:
-        st = street_map.get(sid, {})
-        top_views_list.append({
-            "streetId": sid,
-            "views": c,
-            "name": st.get("name", "Unknown"),
-            "mode": st.get("mode"),
-            "city": st.get("city"),
-            "country": st.get("country"),
-        })
-
-    top_likes_list = sorted(streets_safe, key=lambda x: x.get("likes", 0), reverse=True)[:8]
-
-    recent = []
-    for e in events[:25]:
-        sid = str(e.get("streetId")) if e.get("streetId") else None
-        st = street_map.get(sid, {})
-        recent.append({
-            "eventType": e.get("eventType"),
-            "mode": e.get("mode") or st.get("mode"),
-            "timestamp": to_iso(e.get("timestamp")),
-            "streetId": sid,
-            "streetName": st.get("name"),
-            "city": st.get("city"),
-            "country": st.get("country"),
-        })
-
-    labels, data = [], []
-    if since:
-        for i in range(days - 1, -1, -1):
-            d = (datetime.utcnow() - timedelta(days=i)).strftime("%Y-%m-%d")
-            labels.append(d)
-            data.append(day_counts.get(d, 0))
-    else:
-        for d in sorted(day_counts.keys()):
-            labels.append(d)
-            data.append(day_counts[d])
-
-    return {
-        "totals": totals,
-        "views_chart": {"labels": labels, "data": data},
-        "recent": recent,
-        "top_views": top_views_list,
-        "top_likes": top_likes_list,
-        "streets": streets_safe,
-        "user": {
-            "name": user.get("name") or user.get("email", "User"),
-            "email": user.get("email", ""),
-            "role": user.get("role", "user"),
-            "is_admin": bool(is_admin_user(user)),
-            "createdAt": to_iso(user.get("createdAt")),
-            "lastLoginAt": to_iso(user.get("lastLoginAt")),
-        }
-    }
-
-
-# --------------------------------------------------------
-# Like Endpoint
-# --------------------------------------------------------
-@app.post("/like/<street_id>")
-def like_street(street_id):
-    try:
-        oid = ObjectId(street_id)
-    except InvalidId:
-        return {"error": "Invalid ID"}, 400
-
-    liked = set(session.get("liked", []))
-    if street_id in liked:
-        street = streets_collection.find_one({"_id": oid}, {"likes": 1})
-        return {"likes": street.get("likes", 0) if street else 0}
-
-    streets_collection.update_one({"_id": oid}, {"$inc": {"likes": 1}})
-
-    liked.add(street_id)
-    session["liked"] = list(liked)
-
-    street = streets_collection.find_one({"_id": oid}, {"likes": 1})
-    return {"likes": street.get("likes", 0) if street else 0}
-
-
-# --------------------------------------------------------
-# Start Server (production ready)
-# --------------------------------------------------------
-if __name__ == "__main__":
-    debug = os.getenv("FLASK_DEBUG", "0") == "1"
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=debug)
+import os
+
+# Keep your Windows Cloudinary workaround (harmless in prod; can disable via env if desired)
+os.environ["HTTPX_DISABLE_HTTP2"] = os.getenv("HTTPX_DISABLE_HTTP2", "1")
+
+import uuid
+import heapq
+import logging
+import math
+from bisect import bisect_right
+import queue
+import re
+import threading
+import time
+import smtplib
+from collections import Counter
+from email.message import EmailMessage
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from functools import lru_cache, wraps  # ✅ NEW
+
+from flask import (
+    Flask,
+    render_template,
+    request,
+    redirect,
+    url_for,
+    flash,
+    session,
+    abort,
+    Response,
+    make_response,
+    g,
+)
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from bson.objectid import ObjectId
+from bson.codec_options import CodecOptions, TypeDecoder, TypeRegistry
+from bson.errors import InvalidId
+from dotenv import load_dotenv
+import cloudinary
+import cloudinary.uploader
+import requests
+from requests.adapters import HTTPAdapter, Retry
+
+from authlib.integrations.flask_client import OAuth
+from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# --------------------------------------------------------
+# Logging (production-friendly)
+# --------------------------------------------------------
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------------
+# Load .env variables
+# --------------------------------------------------------
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+
+CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
+CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
+CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
+
+SUPABASE_URL = os.getenv("SUPABASE_URL") or "https://cepabjmlengczyiezdqd.supabase.co"
+SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET") or "streetwalk"
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
+
+# ---------------- MapTiler config ----------------
+MAPTILER_KEY = os.getenv("MAPTILER_KEY")
+MAP_STYLE_URL = (
+    f"https://api.maptiler.com/maps/streets-v2/style.json?key={MAPTILER_KEY}"
+    if MAPTILER_KEY
+    else ""
+)
+
+# --------------------------------------------------------
+# Production toggles
+# --------------------------------------------------------
+ENV = os.getenv("FLASK_ENV", "").lower() or os.getenv("ENV", "").lower() or "production"
+IS_PROD = ENV == "production"
+
+# --------------------------------------------------------
+# Upload limits (HARD server cap)
+# --------------------------------------------------------
+MAX_REQUEST_MB = int(os.getenv("MAX_REQUEST_MB", "120"))
+MAX_CONTENT_LENGTH = MAX_REQUEST_MB * 1024 * 1024
+
+# Per-file limits
+MAX_VIDEO_SIZE = int(os.getenv("MAX_VIDEO_SIZE_MB", "100")) * 1024 * 1024  # default 100MB
+# scrypt (memory-hard, C-backed via hashlib) instead of werkzeug's default
+# PBKDF2, whose 600k SHA256 iterations tie up a login worker far longer for
+# the same attack cost. Format: scrypt:<N>:<r>:<p>.
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+MAX_GLB_SIZE = int(os.getenv("MAX_GLB_SIZE_MB", "50")) * 1024 * 1024      # default 50MB
+MAX_THUMB_SIZE = int(os.getenv("MAX_THUMB_SIZE_MB", "5")) * 1024 * 1024  # default 5MB
+ALLOWED_THUMB_EXT = {"jpg", "jpeg", "png", "webp"}
+
+# Splits pasted video links on commas/newlines in one C-level scan.
+_LINK_SPLIT = re.compile(r"[,\r\n]+")
+
+
+# --------------------------------------------------------
+# Cloudinary Config
+# --------------------------------------------------------
+cloudinary.config(
+    cloud_name=CLOUDINARY_CLOUD_NAME,
+    api_key=CLOUDINARY_API_KEY,
+    api_secret=CLOUDINARY_API_SECRET,
+    secure=True,
+    timeout=int(os.getenv("CLOUDINARY_TIMEOUT", "180")),
+)
+
+# --------------------------------------------------------
+# Flask App
+# --------------------------------------------------------
+app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+
+# orjson-backed JSON provider: the street lists templates embed via |tojson
+# are the largest strings this app builds per request, and orjson encodes
+# them several times faster than the stdlib. Falls back silently when the
+# wheel isn't available (same spirit as the optional Mongo compressors).
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+
+    class OrjsonProvider(JSONProvider):
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+except ImportError:
+    pass
+
+# Cookies hardened for production
+app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.urandom(32)
+app.config.update(
+    SESSION_COOKIE_HTTPONLY=True,
+    SESSION_COOKIE_SAMESITE=os.getenv("SESSION_COOKIE_SAMESITE", "Lax"),
+)
+
+# If you're behind HTTPS (Render/Cloudflare), set this true in prod:
+if os.getenv("SESSION_COOKIE_SECURE", "1" if IS_PROD else "0") == "1":
+    app.config["SESSION_COOKIE_SECURE"] = True
+
+# If you use reverse proxy (Render, Nginx), set this so url_for(_external=True) uses https:
+PREFERRED_URL_SCHEME = os.getenv("PREFERRED_URL_SCHEME")
+if PREFERRED_URL_SCHEME:
+    app.config["PREFERRED_URL_SCHEME"] = PREFERRED_URL_SCHEME
+
+# expose map style to templates
+app.config["MAP_STYLE_URL"] = MAP_STYLE_URL
+
+# --------------------------------------------------------
+# OAuth (Google)
+# --------------------------------------------------------
+oauth = OAuth(app)
+GOOGLE_ENABLED = bool(GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET)
+if GOOGLE_ENABLED:
+    oauth.register(
+        name="google",
+        client_id=GOOGLE_CLIENT_ID,
+        client_secret=GOOGLE_CLIENT_SECRET,
+        server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
+        client_kwargs={"scope": "openid email profile"},
+    )
+else:
+    logger.warning("Google OAuth client ID/secret not set; Google login disabled.")
+
+# --------------------------------------------------------
+# MongoDB Setup
+# --------------------------------------------------------
+if not MONGO_URI:
+    raise RuntimeError("MONGO_URI is not set")
+
+# Explicit pool sizing so worker threads reuse warm TLS connections instead
+# of handshaking on bursts; retryable reads/writes smooth over Atlas elections.
+client = MongoClient(
+    MONGO_URI,
+    maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+    minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "5")),
+    serverSelectionTimeoutMS=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "3000")),
+    waitQueueTimeoutMS=int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000")),
+    socketTimeoutMS=int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000")),
+    connectTimeoutMS=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+    maxIdleTimeMS=int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000")),
+    retryReads=True,
+    retryWrites=True,
+    # Wire compression: the street docs are text-heavy (descriptions, video
+    # URLs), so zstd cuts bytes on the wire several-fold for negligible CPU.
+    # pymongo silently drops compressors whose modules aren't installed.
+    compressors=os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib"),
+    appname="streetwalk",
+)
+db = client["streetwalk"]
+streets_collection = db["streets"]
+
+
+class OidAsStr(TypeDecoder):
+    """Decode ObjectId straight to str while BSON is being parsed.
+
+    Decoder-only on purpose: pymongo refuses TypeEncoders for built-in BSON
+    types, and this view never writes anyway.
+    """
+
+    bson_type = ObjectId
+
+    def transform_bson(self, value):
+        return str(value)
+
+
+# Read-only view for documents that go straight to templates/JSON: ids come
+# back as strings from the BSON decoder itself, so the recursive
+# make_json_safe pass over every listed street disappears. Writes and any
+# code that compares ObjectIds keep using streets_collection.
+streets_json = db.get_collection(
+    "streets",
+    codec_options=CodecOptions(type_registry=TypeRegistry([OidAsStr()])),
+)
+users_collection = db["users"]
+reset_tokens = db["password_resets"]
+activity_logs = db["activity_logs"]
+likes_collection = db["likes"]
+
+# Unlike the bulk index bootstrap below, this one is correctness-critical:
+# like_street relies on DuplicateKeyError from the unique (userId, streetId)
+# index to keep signed-in likes idempotent, so ensure it on every startup
+# (idempotent, one round-trip) rather than only when the operator remembers
+# to run init-indexes.
+try:
+    likes_collection.create_index([("userId", 1), ("streetId", 1)], unique=True)
+except Exception:
+    logger.warning("Could not ensure the unique likes index at startup", exc_info=True)
+geocode_cache = db["geocode_cache"]  # cache Nominatim responses
+
+# --------------------------------------------------------
+# MongoDB Indexes
+# --------------------------------------------------------
+def ensure_indexes():
+    """
+    Idempotent index bootstrap. Creation costs one round-trip per index, so
+    this is meant to run once per deploy (flask init-indexes, or set
+    RUN_INDEX_BOOTSTRAP=1), not on every worker fork / autoreload import.
+    """
+    # Matches the list-route query shape (status/deleted/type/mode/category
+    # equality, newest-first sort) so those reads are pure IXSCANs; supersedes
+    # the old (type, mode) index, which was only a partial prefix.
+    streets_collection.create_index(
+        [
+            ("status", 1),
+            ("deleted", 1),
+            ("type", 1),
+            ("mode", 1),
+            ("category", 1),
+            ("createdAt", -1),
+        ],
+        name="list_feed",
+    )
+    streets_collection.create_index([("createdAt", -1)])
+    # 2dsphere on the GeoJSON point replaces the old flat (lat, lng) B-tree,
+    # which could never serve a viewport/bbox query anyway.
+    streets_collection.create_index([("loc", "2dsphere")])
+    # Backfill loc for documents created before the field existed (pipeline
+    # update, so the conversion happens server-side and is idempotent).
+    streets_collection.update_many(
+        {"loc": {"$exists": False}, "lat": {"$type": "number"}, "lng": {"$type": "number"}},
+        [{"$set": {"loc": {"type": "Point", "coordinates": ["$lng", "$lat"]}}}],
+    )
+    streets_collection.create_index([("ownerId", 1), ("deleted", 1), ("createdAt", -1)])
+
+    # Indexes superseded above are dropped explicitly so existing deployments
+    # stop paying their write amplification too; a missing index is fine.
+    for name in (
+        "type_1_mode_1",  # superseded by list_feed
+        "status_1_type_1_mode_1_category_1_createdAt_-1",  # pre-list_feed shape
+        "likes_-1",  # nothing queries or sorts on likes server-side
+        "lat_1_lng_1",  # superseded by the loc 2dsphere index
+        "ownerId_1_deleted_1",  # superseded by the createdAt-extended variant
+    ):
+        try:
+            streets_collection.drop_index(name)
+        except OperationFailure:
+            pass
+
+    users_collection.create_index("email", unique=True)
+    users_collection.create_index("googleId", unique=True, sparse=True)
+
+    reset_tokens.create_index("token", unique=True)
+    reset_tokens.create_index("expiresAt", expireAfterSeconds=0)
+
+    activity_logs.create_index([("userId", 1), ("timestamp", -1)])
+
+    geocode_cache.create_index("q", unique=True)
+    geocode_cache.create_index("expiresAt", expireAfterSeconds=0)
+
+
+@app.cli.command("init-indexes")
+def init_indexes_command():
+    """Create MongoDB indexes (run once at deploy)."""
+    ensure_indexes()
+    print("Indexes ensured.")
+
+
+if os.getenv("RUN_INDEX_BOOTSTRAP") == "1":
+    ensure_indexes()
+
+# --------------------------------------------------------
+# Helpers
+# --------------------------------------------------------
+def clean_text(value, max_len=200):
+    if not value:
+        return None
+    return value.strip()[:max_len]
+
+
+def make_json_safe(obj):
+    if obj is None:
+        return None
+
+    if isinstance(obj, ObjectId):
+        return str(obj)
+
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            if isinstance(v, ObjectId):
+                out[k] = str(v)
+            elif isinstance(v, (dict, list)):
+                out[k] = make_json_safe(v)
+            else:
+                out[k] = v
+        return out
+
+    if isinstance(obj, list):
+        return [make_json_safe(x) for x in obj]
+
+    return obj
+
+
+# Shared base filter for every public list/detail query. Callers get a fresh
+# dict each time (a C-level merge/copy), never this shared instance.
+_BASE_FILTER = {"status": "published", "deleted": False}
+
+
+def published_not_deleted(extra=None):
+    return {**_BASE_FILTER, **extra} if extra else dict(_BASE_FILTER)
+
+
+def geo_point(lat, lng):
+    # GeoJSON is [lng, lat] order; stored alongside the flat lat/lng fields
+    # so the 2dsphere index can serve viewport queries.
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+# Fields the map pins and listing cards actually render. Projecting keeps
+# the long descriptions and misc metadata of other docs off the wire on list
+# pages; only the detail fetch pulls complete documents. videos must stay
+# whole: the world pages play all parts straight from the projected list and
+# the list cards show a part count.
+LIST_PROJECTION = {
+    "lat": 1,
+    "lng": 1,
+    "name": 1,
+    "city": 1,
+    "country": 1,
+    "type": 1,
+    "mode": 1,
+    "category": 1,
+    "description": 1,
+    "likes": 1,
+    "createdAt": 1,
+    "is_tour": 1,
+    "tour_category": 1,
+    "tour_best_time": 1,
+    "thumbnail_url": 1,
+    "glbUrl": 1,
+    "videos": 1,
+}
+
+
+def streets_etag_tag():
+    """
+    Cheap signature of the published street list: document count plus the
+    newest createdAt and updatedAt. Changes whenever a street is added,
+    edited or soft-deleted, so it is safe to use as a weak ETag for list
+    pages.
+    """
+    sig = list(
+        streets_collection.aggregate(
+            [
+                {"$match": {"status": "published", "deleted": False}},
+                {
+                    "$group": {
+                        "_id": None,
+                        "n": {"$sum": 1},
+                        "t": {"$max": "$createdAt"},
+                        "u": {"$max": "$updatedAt"},
+                    }
+                },
+            ]
+        )
+    )
+    if not sig:
+        return "0-0-0"
+    n = sig[0].get("n", 0)
+    t = sig[0].get("t")
+    u = sig[0].get("u")
+    ts = int(t.timestamp()) if isinstance(t, datetime) else 0
+    us = int(u.timestamp()) if isinstance(u, datetime) else 0
+    return f"{n}-{ts}-{us}"
+
+
+# In-process TTL cache for per-mode category lists: they only change when a
+# street is uploaded, so list pages should not pay a distinct() scan per hit.
+CATEGORY_CACHE_TTL = int(os.getenv("CATEGORY_CACHE_TTL", "300"))
+_category_cache = {}
+_category_cache_lock = threading.Lock()
+
+
+def distinct_categories_for_mode(mode: str):
+    now = time.monotonic()
+    with _category_cache_lock:
+        hit = _category_cache.get(mode)
+        if hit and hit[0] > now:
+            return hit[1]
+
+    cats = streets_collection.distinct(
+        "category",
+        {"type": "video", "mode": mode, "status": "published", "deleted": False},
+    )
+    cats = sorted(c for c in cats if c)
+
+    with _category_cache_lock:
+        _category_cache[mode] = (now + CATEGORY_CACHE_TTL, cats)
+    return cats
+
+
+def invalidate_category_cache(mode=None):
+    with _category_cache_lock:
+        if mode is None:
+            _category_cache.clear()
+        else:
+            _category_cache.pop(mode, None)
+
+
+# Whole-page cache for the anonymous read-only list/map pages. Keys include
+# the full query string (so ?category= variants are cached separately) and a
+# version counter bumped by every street write, which invalidates all cached
+# variants at once. Logged-in visitors see a personalised navbar and requests
+# with pending flashes must render them, so both bypass the cache.
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "60"))
+PAGE_CACHE_MAX = int(os.getenv("PAGE_CACHE_MAX", "256"))
+_page_cache = {}
+_page_cache_lock = threading.Lock()
+_streets_version = 0
+
+
+def bump_streets_version():
+    global _streets_version
+    with _page_cache_lock:
+        _streets_version += 1
+        _page_cache.clear()
+
+
+def cached_page(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if session.get("user_id") or session.get("_flashes"):
+            return fn(*args, **kwargs)
+
+        key = (request.full_path, _streets_version)
+        now = time.monotonic()
+        with _page_cache_lock:
+            hit = _page_cache.get(key)
+            if hit and hit[0] > now:
+                _, body, status, headers = hit
+                # Rebuild a fresh Response per hit: after_request hooks
+                # (make_conditional in particular) mutate responses in
+                # place, so handing out one shared object would let a 304
+                # for visitor A leak to everyone else.
+                return Response(body, status=status, headers=headers)
+
+        resp = make_response(fn(*args, **kwargs))
+        if resp.status_code == 200:
+            entry = (now + PAGE_CACHE_TTL, resp.get_data(), resp.status_code, list(resp.headers))
+            with _page_cache_lock:
+                if len(_page_cache) >= PAGE_CACHE_MAX:
+                    # Keys include the query string, so a crawler walking
+                    # random ?category= URLs could otherwise grow this without
+                    # bound: purge dead entries first, then evict the
+                    # soonest-to-expire one if the cache is still full.
+                    for stale in [k for k, v in _page_cache.items() if v[0] <= now]:
+                        del _page_cache[stale]
+                    if len(_page_cache) >= PAGE_CACHE_MAX:
+                        del _page_cache[min(_page_cache, key=lambda k: _page_cache[k][0])]
+                _page_cache[key] = entry
+        return resp
+
+    return wrapper
+def upload_size(file):
+    """
+    Actual size of an uploaded file, measured by seeking the spool. The
+    multipart part's own Content-Length header is client-controlled and
+    unverified by werkzeug, so it must never be trusted for enforcement or
+    forwarded upstream.
+    """
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    return size
+
+
+def exceeds_limit(file, limit):
+    """
+    Per-file size cap. The declared part size is only used as a fast-path
+    reject (a client overstating its upload saves us the I/O); anything at or
+    under the limit is confirmed against the measured spool, because the
+    declaration can just as easily be spoofed low.
+    """
+    if (getattr(file, "content_length", 0) or 0) > limit:
+        return True
+    return upload_size(file) > limit
+
+
+def allowed_thumb(filename: str) -> bool:
+    if not filename:
+        return False
+    ext = filename.rsplit(".", 1)[-1].lower()
+    return ext in ALLOWED_THUMB_EXT
+
+
+
+@lru_cache(maxsize=4096)
+def _fmt_day(year, month, day):
+    return datetime(year, month, day).strftime("%d %b %Y")
+
+
+def format_date(dt):
+    # Rendered once per listed row; strftime's locale machinery is slow
+    # enough to be worth memoizing per calendar day (many streets share one).
+    if not dt:
+        return ""
+    if isinstance(dt, datetime):
+        u = dt.astimezone(timezone.utc)
+        return _fmt_day(u.year, u.month, u.day)
+    return ""
+
+
+def to_iso(dt):
+    if not dt:
+        return None
+    if isinstance(dt, datetime):
+        # always return UTC ISO
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.astimezone(timezone.utc).isoformat()
+    return None
+
+
+def start_date_for_range(days: int):
+    # days=0 -> all time
+    if not days or days <= 0:
+        return None
+    return datetime.utcnow() - timedelta(days=days)
+
+
+# Sentinel distinguishing "not resolved yet" from "resolved to anonymous".
+_USER_UNRESOLVED = object()
+
+# Cross-request user cache so repeat requests skip Mongo entirely. The short
+# TTL bounds staleness; auth and role writes invalidate explicitly so logins
+# and promotions take effect immediately.
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+
+def _user_cache_get(uid):
+    now = time.monotonic()
+    with _user_cache_lock:
+        hit = _user_cache.get(uid)
+        if hit and hit[0] > now:
+            # Copy so a view mutating its user dict can't poison the cache.
+            return dict(hit[1])
+    return None
+
+
+def _user_cache_put(uid, user):
+    with _user_cache_lock:
+        _user_cache[uid] = (time.monotonic() + USER_CACHE_TTL, dict(user))
+
+
+def invalidate_user_cache(uid):
+    with _user_cache_lock:
+        _user_cache.pop(str(uid), None)
+
+
+def current_user():
+    # Request-scoped memoization on flask.g: the context processor runs on
+    # every render and most authed views call this too, which used to mean
+    # one Mongo find_one per call. g is per-request, so no teardown needed.
+    cached = g.get("_cached_user", _USER_UNRESOLVED)
+    if cached is not _USER_UNRESOLVED:
+        return cached
+
+    user = None
+    uid = session.get("user_id")
+    oid = _oid(uid)
+    if oid is not None:
+        user = _user_cache_get(uid)
+        if user is None:
+            user = users_collection.find_one({"_id": oid}, {"passwordHash": 0, "googleId": 0})
+            if user:
+                user["_id"] = str(user["_id"])
+                _user_cache_put(uid, user)
+
+    g._cached_user = user
+    return user
+
+
+def is_admin_user(user) -> bool:
+    """
+    Production-safe admin check.
+    Use DB field 'role' == 'admin' instead of a session flag.
+    """
+    if not user:
+        return False
+    return user.get("role") == "admin"
+
+
+# ✅ admin guard decorator
+def admin_required(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        user = current_user()
+        if not user:
+            session["next"] = request.path
+            return redirect(url_for("login"))
+        if not is_admin_user(user):
+            abort(403)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+# Keep-alive session for Supabase storage uploads: reuses pooled TCP+TLS
+# connections per worker instead of paying a fresh handshake on every upload.
+# The Retry only re-attempts connection setup and idempotent requests —
+# streamed POST bodies are never replayed.
+supabase_session = requests.Session()
+supabase_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    ),
+)
+if SUPABASE_SERVICE_KEY:
+    supabase_session.headers.update(
+        {"apikey": SUPABASE_SERVICE_KEY, "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}"}
+    )
+
+# Separate keep-alive session for Nominatim (no shared headers with the
+# Supabase one). Retries stay in geocode_place's own backoff loop, which
+# also handles 429s, so the adapter does none.
+nominatim_session = requests.Session()
+nominatim_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+
+def upload_glb_supabase(file):
+    if not SUPABASE_SERVICE_KEY:
+        raise RuntimeError("SUPABASE_SERVICE_KEY not set")
+
+    filename = f"models/{uuid.uuid4()}.glb"
+    upload_url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{filename}"
+
+    # Stream straight from the spooled upload instead of buffering the whole
+    # GLB (up to 50MB) into a bytes object first. Supabase wants an explicit
+    # Content-Length; upload_size measures the spool, so the header always
+    # matches the bytes actually sent.
+    size = upload_size(file)
+
+    headers = {
+        "Content-Type": "model/gltf-binary",
+        "Content-Length": str(size),
+    }
+
+    res = supabase_session.post(upload_url, headers=headers, data=file.stream, timeout=180)
+
+    if res.status_code in (200, 201):
+        return f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{filename}"
+    logger.error("Supabase upload failed: %s", res.text)
+    raise Exception(f"Supabase Upload Failed: {res.text}")
+
+
+def upload_video_cloudinary(file):
+    # upload_large sends the video in ~6MB chunks straight from the spool
+    # instead of one monolithic HTTP body: resumable, streaming-friendly and
+    # immune to proxy body-size limits. One rewind-and-retry covers transient
+    # chunk failures.
+    chunk_size = int(os.getenv("CLOUDINARY_CHUNK_SIZE", str(6_000_000)))
+    attempts = 2
+    for attempt in range(1, attempts + 1):
+        try:
+            upload = cloudinary.uploader.upload_large(
+                file,
+                folder="streetwalk_videos",
+                resource_type="video",
+                chunk_size=chunk_size,
+                timeout=int(os.getenv("CLOUDINARY_TIMEOUT", "180")),
+            )
+            return upload["secure_url"]
+        except Exception:
+            if attempt == attempts:
+                logger.error("Cloudinary video upload failed", exc_info=True)
+                raise
+            logger.warning(
+                "Cloudinary chunked upload failed (attempt %s/%s), retrying",
+                attempt, attempts,
+            )
+            file.seek(0)
+
+def upload_image_cloudinary(file):
+    try:
+        upload = cloudinary.uploader.upload(
+            file,
+            folder="streetwalk_thumbs",
+            resource_type="image",
+            timeout=int(os.getenv("CLOUDINARY_TIMEOUT", "180")),
+        )
+        return upload["secure_url"]
+    except Exception:
+        logger.error("Cloudinary thumbnail upload failed", exc_info=True)
+        raise
+
+def center_for(streets, selected_street=None):
+    """Map center: the selected street if any, else the first pin, else Dubai."""
+    for doc in (selected_street, streets[0] if streets else None):
+        if doc and "lat" in doc and "lng" in doc:
+            return {"lat": doc["lat"], "lng": doc["lng"]}
+    return {"lat": 25.2048, "lng": 55.2708}
+
+
+def _oid(value):
+    """
+    Parse an ObjectId, returning None on bad input. ObjectId.is_valid is a
+    cheap C-level check, so malformed ids skip the exception-unwinding cost
+    of the try/except pattern on hot paths.
+    """
+    if value and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+
+def select_street(street_id, extra=None):
+    """
+    Resolve a ?street_id= query param against the published/not-deleted
+    filter plus any extra mode/type constraints, pushed into the Mongo query
+    itself so one indexed find_one replaces fetch-then-validate.
+
+    Returns (doc, error) where error is None, "not_found" or "unavailable".
+    """
+    oid = _oid(street_id)
+    if oid is None:
+        return None, "not_found" if street_id else None
+
+    doc = streets_json.find_one({"_id": oid, **published_not_deleted(extra)})
+    if doc:
+        return doc, None
+
+    # Distinguish a missing id from an existing-but-unavailable street with a
+    # cheap existence check (only runs on the miss path).
+    if streets_collection.count_documents({"_id": oid}, limit=1):
+        return None, "unavailable"
+    return None, "not_found"
+
+
+def get_street_by_id(street_id):
+    oid = _oid(street_id)
+    if oid is None:
+        return None
+    return streets_json.find_one({"_id": oid})
+
+
+# ---------------- Email sender (Password reset) ----------------
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASS = os.getenv("SMTP_PASS")
+SMTP_FROM = os.getenv("SMTP_FROM")  # e.g. "ABTO <no-reply@yourdomain.com>"
+APP_BASE_URL = os.getenv("APP_BASE_URL")  # e.g. "https://abto.yourdomain.com"
+
+
+def send_email(to_email: str, subject: str, body_text: str):
+    if not (SMTP_HOST and SMTP_USER and SMTP_PASS and SMTP_FROM):
+        logger.error("Email is not configured (SMTP_* missing).")
+        raise RuntimeError("Email service not configured")
+
+    msg = EmailMessage()
+    msg["From"] = SMTP_FROM
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.set_content(body_text)
+
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=15) as s:
+        s.starttls()
+        s.login(SMTP_USER, SMTP_PASS)
+        s.send_message(msg)
+
+
+# ---------------- Nominatim: caching + backoff ----------------
+def _cache_key_for_query(query: str) -> str:
+    return " ".join(query.strip().lower().split())
+
+
+# In-memory layer in front of the Mongo geocode cache: repeat queries for the
+# same few city names resolve without any round-trip at all. Successful
+# lookups live for GEO_CACHE_TTL, "no result" answers for the shorter
+# GEO_CACHE_MISS_TTL so typos don't stick for a day.
+GEO_CACHE_TTL = int(os.getenv("GEO_CACHE_TTL", str(24 * 3600)))
+GEO_CACHE_MISS_TTL = int(os.getenv("GEO_CACHE_MISS_TTL", "3600"))
+_geo_cache = {}
+_geo_cache_lock = threading.Lock()
+_GEO_UNCACHED = object()  # distinguishes "no entry" from a cached None
+
+
+def _geo_cache_get(q):
+    now = time.monotonic()
+    with _geo_cache_lock:
+        hit = _geo_cache.get(q)
+        if hit and hit[0] > now:
+            return hit[1]
+    return _GEO_UNCACHED
+
+
+def _geo_cache_put(q, data):
+    ttl = GEO_CACHE_TTL if data is not None else GEO_CACHE_MISS_TTL
+    with _geo_cache_lock:
+        _geo_cache[q] = (time.monotonic() + ttl, data)
+
+
+def geocode_place(query: str):
+    if not query:
+        return None
+
+    q = _cache_key_for_query(query)
+
+    hit = _geo_cache_get(q)
+    if hit is not _GEO_UNCACHED:
+        return hit
+
+    cached = geocode_cache.find_one({"q": q})
+    if cached and ("data" in cached):
+        _geo_cache_put(q, cached["data"])
+        return cached["data"]
+
+    base_url = os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org/search")
+    params = {"q": query, "format": "json", "limit": 1}
+
+    headers = {
+        "User-Agent": os.getenv(
+            "NOMINATIM_USER_AGENT",
+            "ABTO/1.0 (contact: support@yourdomain.com)",
+        )
+    }
+
+    max_attempts = int(os.getenv("NOMINATIM_MAX_ATTEMPTS", "4"))
+    base_sleep = float(os.getenv("NOMINATIM_BASE_SLEEP", "0.6"))
+    timeout = float(os.getenv("NOMINATIM_TIMEOUT", "10"))
+
+    last_exc = None
+    for attempt in range(1, max_attempts + 1):
+        try:
+            res = nominatim_session.get(base_url, params=params, headers=headers, timeout=timeout)
+
+            if res.status_code in (429, 500, 502, 503, 504):
+                sleep_s = base_sleep * (2 ** (attempt - 1))
+                logger.warning(
+                    "Nominatim %s attempt %s/%s. Sleeping %.2fs",
+                    res.status_code, attempt, max_attempts, sleep_s
+                )
+                time.sleep(sleep_s)
+                continue
+
+            res.raise_for_status()
+
+            results = res.json() if res.text else []
+            if not results:
+                geocode_cache.update_one(
+                    {"q": q},
+                    {"$set": {"q": q, "data": None, "expiresAt": datetime.utcnow() + timedelta(hours=6)}},
+                    upsert=True,
+                )
+                _geo_cache_put(q, None)
+                return None
+
+            r = results[0]
+            lat = float(r["lat"])
+            lon = float(r["lon"])
+            data = {"lat": lat, "lng": lon, "display_name": r.get("display_name", query)}
+
+            geocode_cache.update_one(
+                {"q": q},
+                {"$set": {"q": q, "data": data, "expiresAt": datetime.utcnow() + timedelta(days=30)}},
+                upsert=True,
+            )
+            _geo_cache_put(q, data)
+            return data
+
+        except Exception as exc:
+            last_exc = exc
+            sleep_s = base_sleep * (2 ** (attempt - 1))
+            logger.warning(
+                "Nominatim error attempt %s/%s: %s. Sleeping %.2fs",
+                attempt, max_attempts, exc, sleep_s
+            )
+            time.sleep(sleep_s)
+
+    if last_exc:
+        raise last_exc
+    return None
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    R = 6371.0
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+# Fare tiers as a table instead of an if/elif chain: each entry is
+# (tier start km, AED per km), and _PRICE_CUM precomputes the cost of all
+# complete tiers below a start point. Adding a tier is one tuple, and the
+# lookup is a bisect instead of a growing branch ladder. Output for the
+# current two tiers is identical to the old arithmetic.
+_PRICE_BASE = 200.0
+_PRICE_BREAKS = (0.0, 2000.0)
+_PRICE_RATES = (0.45, 0.35)
+_PRICE_CUM = tuple(
+    sum(
+        (_PRICE_BREAKS[j + 1] - _PRICE_BREAKS[j]) * _PRICE_RATES[j]
+        for j in range(i)
+    )
+    for i in range(len(_PRICE_BREAKS))
+)
+
+
+def estimate_price_aed(distance_km: float) -> dict:
+    if distance_km <= 0:
+        approx = 400.0
+    else:
+        i = bisect_right(_PRICE_BREAKS, distance_km) - 1
+        approx = _PRICE_BASE + _PRICE_CUM[i] + (distance_km - _PRICE_BREAKS[i]) * _PRICE_RATES[i]
+
+    low = round(approx * 0.8 / 10) * 10
+    high = round(approx * 1.2 / 10) * 10
+    mid = round(approx / 10) * 10
+    return {"currency": "AED", "low": float(low), "high": float(high), "mid": float(mid)}
+
+
+def build_price_texts(distance_km: float, price_info: dict):
+    distance_text = f"Distance: approx. {distance_km:,.1f} km (great-circle estimate)."
+    currency = price_info.get("currency", "AED")
+    low = price_info.get("low", 0.0)
+    high = price_info.get("high", 0.0)
+    mid = price_info.get("mid", 0.0)
+    price_text = (
+        f"Estimated one-way economy flight budget: "
+        f"{currency} {low:,.0f} – {currency} {high:,.0f} "
+        f"(typical ~ {currency} {mid:,.0f} per person)."
+    )
+    return distance_text, price_text
+
+
+# map_style_url never changes after startup, so it belongs in the Jinja
+# globals (resolved once at import) rather than a per-request context dict.
+app.jinja_env.globals["map_style_url"] = MAP_STYLE_URL
+
+
+@app.context_processor
+def inject_current_user():
+    return {"current_user": current_user()}
+
+
+# --------------------------------------------------------
+# Conditional responses for the read-only list/map pages
+# --------------------------------------------------------
+LIST_PAGE_ENDPOINTS = frozenset(
+    {
+        "index",
+        "world",
+        "world_walk",
+        "world_drive",
+        "world_fly",
+        "world_sit",
+        "walk",
+        "drive",
+        "fly",
+        "sit",
+    }
+)
+
+LIST_PAGE_CACHE_CONTROL = os.getenv(
+    "LIST_PAGE_CACHE_CONTROL", "public, max-age=60, stale-while-revalidate=300"
+)
+
+
+@app.after_request
+def conditional_list_pages(resp):
+    # Weak ETag from the Mongo-derived street signature (the same validator
+    # index uses): repeat anonymous visitors get a 304 for the render cost of
+    # one tiny aggregate. A per-process counter can't be the validator here —
+    # gunicorn forks several workers and a write only bumps the counter in
+    # the worker that handled it, so the others would keep revalidating
+    # pre-write tags indefinitely. make_conditional respects ETags a view
+    # already set.
+    if (
+        request.endpoint in LIST_PAGE_ENDPOINTS
+        and request.method == "GET"
+        and resp.status_code == 200
+        and not session.get("user_id")
+    ):
+        if not resp.get_etag()[0]:
+            resp.set_etag(streets_etag_tag(), weak=True)
+        if "Cache-Control" not in resp.headers:
+            # Short shared max-age so browsers/CDNs skip the request
+            # entirely, with a stale-while-revalidate window so the refresh
+            # happens off the visitor's critical path.
+            resp.headers["Cache-Control"] = LIST_PAGE_CACHE_CONTROL
+        resp.make_conditional(request)
+    return resp
+
+
+# --------------------------------------------------------
+# Error handling: large uploads (MAX_CONTENT_LENGTH)
+# --------------------------------------------------------
+@app.errorhandler(RequestEntityTooLarge)
+def handle_large_upload(e):
+    flash(f"Upload too large. Max request size is {MAX_REQUEST_MB}MB.", "error")
+    ref = request.referrer or url_for("upload")
+    return redirect(ref)
+
+
+# --------------------------------------------------------
+# Route protection for upload & dashboard
+# --------------------------------------------------------
+# Built once at import: the before_request hook runs on every request, so the
+# membership tests should be O(1) hash lookups, not scans of a per-call tuple.
+PUBLIC_ENDPOINTS = frozenset(
+    {
+        None,
+        "static",
+        "index",
+        "world",
+        "world_walk",
+        "world_drive",
+        "world_fly",
+        "world_sit",
+        "walk",
+        "drive",
+        "fly",
+        "sit",
+        "how_it_works",  # ✅ NEW: public page
+        "login",
+        "signup",
+        "forgot_password",
+        "reset_password",
+        "login_google",
+        "auth_google_callback",
+        "logout",
+        "api_price",
+        "api_streets_in_view",
+        "like_street",
+        # ✅ allow admin pages to be protected by decorator (not here)
+    }
+)
+
+PROTECTED_ENDPOINTS = frozenset(
+    {"upload", "dashboard", "edit_street", "delete_street", "log_activity"}
+)
+
+
+@app.before_request
+def protect_protected_routes():
+    endpoint = request.endpoint
+    # Static assets are the most frequent requests of all; bail before even
+    # touching the session.
+    if endpoint == "static" or endpoint in PUBLIC_ENDPOINTS:
+        return
+
+    if endpoint in PROTECTED_ENDPOINTS and not session.get("user_id"):
+        session["next"] = request.path
+        return redirect(url_for("login"))
+
+
+# --------------------------------------------------------
+# Home Page
+# --------------------------------------------------------
+@app.route("/")
+@cached_page
+def index():
+    # Conditional response: repeat visitors/CDNs get a 304 and we skip both
+    # the Mongo queries and the Jinja render. Skip when flashes are pending
+    # so messages are never swallowed by a cached page.
+    etag = streets_etag_tag()
+    if not session.get("_flashes") and request.if_none_match.contains_weak(etag):
+        return Response(status=304)
+
+    # One round-trip for both lists: the shared published/not-deleted $match
+    # runs first (on the list_feed index), then $facet splits the matched set
+    # into the full pin list and the 8 newest tours.
+    facet = next(
+        streets_json.aggregate(
+            [
+                {"$match": published_not_deleted()},
+                {
+                    "$facet": {
+                        "all": [{"$project": LIST_PROJECTION}],
+                        "tours": [
+                            {"$match": {"type": "video", "is_tour": True}},
+                            {"$sort": {"createdAt": -1}},
+                            {"$limit": 8},
+                            {"$project": LIST_PROJECTION},
+                        ],
+                    }
+                },
+            ]
+        ),
+        {},
+    )
+    streets = facet.get("all", [])
+    tour_streets = facet.get("tours", [])
+
+    resp = make_response(
+        render_template(
+            "index.html",
+            streets=streets,
+            tour_streets=tour_streets,
+        )
+    )
+    resp.set_etag(etag, weak=True)
+    resp.headers["Cache-Control"] = "public, max-age=30"
+    return resp
+
+
+# --------------------------------------------------------
+# ✅ NEW: How ABTO Works (separate page)
+# --------------------------------------------------------
+@app.route("/how-it-works")
+def how_it_works():
+    return render_template("how_it_works.html")
+
+
+# --------------------------------------------------------
+# Generic World Page
+# --------------------------------------------------------
+@app.route("/world")
+@cached_page
+def world():
+    # Resolve the selection first: when a street is chosen it provides the
+    # map center directly and only its mode's pin list is fetched, so the
+    # common ?street_id= case skips the all-streets query entirely.
+    street_id = request.args.get("street_id")
+    selected_street, street_error = select_street(street_id)
+
+    if selected_street:
+        mode = selected_street.get("mode", "walk")
+        template_map = {
+            "walk": "world.html",
+            "drive": "drive_world.html",
+            "fly": "fly_world.html",
+            "sit": "sit_world.html",
+        }
+        template = template_map.get(mode, "world.html")
+
+        mode_streets = list(
+            streets_json.find(published_not_deleted({"mode": mode}), LIST_PROJECTION)
+        )
+
+        return render_template(
+            template,
+            streets=mode_streets,
+            center=center_for(mode_streets, selected_street),
+            selected_street=selected_street,
+            street_error=street_error,
+            mode=mode,
+        )
+
+    streets = list(
+        streets_json.find(published_not_deleted(), LIST_PROJECTION)
+    )
+
+    return render_template(
+        "world.html",
+        streets=streets,
+        center=center_for(streets),
+        selected_street=None,
+        street_error=street_error,
+    )
+
+
+# --------------------------------------------------------
+# WALK world
+# --------------------------------------------------------
+@app.route("/world/walk")
+def world_walk():
+    street_id = request.args.get("street_id")
+    selected_street, street_error = select_street(
+        street_id, {"$or": [{"type": "3d"}, {"type": "video", "mode": "walk"}]}
+    )
+
+    streets = list(
+        streets_json.find(
+            published_not_deleted({"$or": [{"type": "3d"}, {"type": "video", "mode": "walk"}]}),
+            LIST_PROJECTION,
+        )
+    )
+
+    return render_template(
+        "world.html",
+        streets=streets,
+        center=center_for(streets, selected_street),
+        selected_street=selected_street,
+        street_error=street_error,
+    )
+
+
+# --------------------------------------------------------
+# DRIVE world
+# --------------------------------------------------------
+@app.route("/world/drive")
+def world_drive():
+    street_id = request.args.get("street_id")
+    selected_street, street_error = select_street(street_id, {"type": "video", "mode": "drive"})
+
+    streets = list(
+        streets_json.find(published_not_deleted({"type": "video", "mode": "drive"}), LIST_PROJECTION)
+    )
+
+    return render_template(
+        "drive_world.html",
+        streets=streets,
+        center=center_for(streets, selected_street),
+        selected_street=selected_street,
+        street_error=street_error,
+    )
+
+
+# --------------------------------------------------------
+# FLY world
+# --------------------------------------------------------
+@app.route("/world/fly")
+def world_fly():
+    street_id = request.args.get("street_id")
+    selected_street, street_error = select_street(street_id, {"type": "video", "mode": "fly"})
+
+    streets = list(
+        streets_json.find(published_not_deleted({"type": "video", "mode": "fly"}), LIST_PROJECTION)
+    )
+
+    return render_template(
+        "fly_world.html",
+        streets=streets,
+        center=center_for(streets, selected_street),
+        selected_street=selected_street,
+        street_error=street_error,
+    )
+
+
+# --------------------------------------------------------
+# SIT world
+# --------------------------------------------------------
+@app.route("/world/sit")
+def world_sit():
+    street_id = request.args.get("street_id")
+    selected_street, street_error = select_street(street_id, {"type": "video", "mode": "sit"})
+
+    streets = list(
+        streets_json.find(published_not_deleted({"type": "video", "mode": "sit"}), LIST_PROJECTION)
+    )
+
+    return render_template(
+        "sit_world.html",
+        streets=streets,
+        center=center_for(streets, selected_street),
+        selected_street=selected_street,
+        street_error=street_error,
+    )
+
+
+# --------------------------------------------------------
+# LIST PAGES
+# --------------------------------------------------------
+@app.route("/walk")
+@cached_page
+def walk():
+    category = request.args.get("category", "").strip() or None
+    query = published_not_deleted({"type": "video", "mode": "walk"})
+    if category and category.lower() != "all":
+        query["category"] = category
+    walk_streets = list(streets_json.find(query, LIST_PROJECTION))
+    categories = distinct_categories_for_mode("walk")
+    return render_template("walk.html", streets=walk_streets, categories=categories, active_category=category or "all")
+
+
+@app.route("/drive")
+@cached_page
+def drive():
+    category = request.args.get("category", "").strip() or None
+    query = published_not_deleted({"type": "video", "mode": "drive"})
+    if category and category.lower() != "all":
+        query["category"] = category
+    drive_streets = list(streets_json.find(query, LIST_PROJECTION))
+    categories = distinct_categories_for_mode("drive")
+    return render_template("drive.html", streets=drive_streets, categories=categories, active_category=category or "all")
+
+
+@app.route("/fly")
+@cached_page
+def fly():
+    category = request.args.get("category", "").strip() or None
+    query = published_not_deleted({"type": "video", "mode": "fly"})
+    if category and category.lower() != "all":
+        query["category"] = category
+    fly_streets = list(streets_json.find(query, LIST_PROJECTION))
+    categories = distinct_categories_for_mode("fly")
+    return render_template("fly.html", streets=fly_streets, categories=categories, active_category=category or "all")
+
+
+@app.route("/sit")
+@cached_page
+def sit():
+    category = request.args.get("category", "").strip() or None
+    query = published_not_deleted({"type": "video", "mode": "sit"})
+    if category and category.lower() != "all":
+        query["category"] = category
+    sit_streets = list(streets_json.find(query, LIST_PROJECTION))
+    categories = distinct_categories_for_mode("sit")
+    return render_template("sit.html", streets=sit_streets, categories=categories, active_category=category or "all")
+
+
+# --------------------------------------------------------
+# Signup
+# --------------------------------------------------------
+@app.route("/signup", methods=["GET", "POST"])
+def signup():
+    if request.method == "POST":
+        email = request.form["email"].strip().lower()
+        name = request.form["name"].strip()
+        password = request.form["password"]
+
+        if users_collection.find_one({"email": email}):
+            flash("Email already registered", "error")
+            return redirect(url_for("signup"))
+
+        users_collection.insert_one(
+            {
+                "email": email,
+                "name": name,
+                "passwordHash": generate_password_hash(password, method=PASSWORD_HASH_METHOD),
+                "createdAt": datetime.utcnow(),
+                "lastLoginAt": None,
+                "role": "user",
+            }
+        )
+        flash("Account created. Please log in.", "success")
+        return redirect(url_for("login"))
+
+    return render_template("signup.html")
+
+
+# --------------------------------------------------------
+# Email/password Login
+# --------------------------------------------------------
+@app.route("/login", methods=["GET", "POST"])
+def login():
+    if request.method == "POST":
+        email = request.form["email"].strip().lower()
+        password = request.form["password"]
+
+        # Only the fields the login path touches; the full doc (historical
+        # fields, Google profile data) stays on the server.
+        user = users_collection.find_one(
+            {"email": email}, {"passwordHash": 1, "name": 1, "email": 1}
+        )
+        if not user or not user.get("passwordHash"):
+            flash("Invalid email or password", "error")
+            return redirect(url_for("login"))
+
+        if not check_password_hash(user["passwordHash"], password):
+            flash("Invalid email or password", "error")
+            return redirect(url_for("login"))
+
+        update = {"lastLoginAt": datetime.utcnow()}
+        # Lazy migration: legacy PBKDF2 rows get rehashed with the current
+        # method on their next successful login, piggybacking on the
+        # lastLoginAt write.
+        if not user["passwordHash"].startswith(PASSWORD_HASH_METHOD.split(":")[0] + ":"):
+            update["passwordHash"] = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+        users_collection.update_one({"_id": user["_id"]}, {"$set": update})
+        invalidate_user_cache(user["_id"])
+
+        # Only the id goes into the cookie; the name/email come from
+        # current_user(), so duplicating them here just bloats every
+        # request's signed payload.
+        session["user_id"] = str(user["_id"])
+
+        next_url = session.pop("next", None) or url_for("index")
+        return redirect(next_url)
+
+    return render_template("login.html")
+
+
+# --------------------------------------------------------
+# Logout
+# --------------------------------------------------------
+@app.route("/logout")
+def logout():
+    session.clear()
+    flash("You have been signed out.", "info")
+    return redirect(url_for("index"))
+
+
+# --------------------------------------------------------
+# Google Login
+# --------------------------------------------------------
+@app.route("/login/google")
+def login_google():
+    if not GOOGLE_ENABLED:
+        flash("Google login is not configured.", "error")
+        return redirect(url_for("login"))
+
+    next_url = request.args.get("next") or session.get("next") or url_for("index")
+    session["next"] = next_url
+
+    redirect_uri = url_for("auth_google_callback", _external=True)
+    return oauth.google.authorize_redirect(redirect_uri)
+
+
+@app.route("/auth/google/callback")
+def auth_google_callback():
+    if not GOOGLE_ENABLED:
+        flash("Google login is not configured.", "error")
+        return redirect(url_for("login"))
+
+    oauth.google.authorize_access_token()
+    userinfo = oauth.google.userinfo()
+
+    google_id = userinfo.get("sub")
+    email = (userinfo.get("email") or "").lower()
+    name = userinfo.get("name") or ""
+    now = datetime.utcnow()
+
+    # One atomic upsert replaces the find-by-googleId / find-by-email /
+    # update-or-insert ladder, and two simultaneous first logins can no
+    # longer race into duplicate accounts.
+    match = {"$or": [{"googleId": google_id}, {"email": email}]} if email else {"googleId": google_id}
+    user = users_collection.find_one_and_update(
+        match,
+        {
+            "$set": {"googleId": google_id, "email": email, "name": name, "lastLoginAt": now},
+            "$setOnInsert": {"createdAt": now, "role": "user"},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        projection={"passwordHash": 0},
+    )
+
+    invalidate_user_cache(user["_id"])
+    session["user_id"] = str(user["_id"])
+
+    next_url = session.pop("next", None)
+    return redirect(next_url or url_for("index"))
+
+
+# --------------------------------------------------------
+# Forgot / Reset Password (PRODUCTION READY)
+# --------------------------------------------------------
+@app.route("/forgot-password", methods=["GET", "POST"])
+def forgot_password():
+    if request.method == "POST":
+        email = request.form["email"].strip().lower()
+        user = users_collection.find_one({"email": email})
+
+        flash("If that email exists, a reset link has been sent.", "info")
+
+        if user:
+            token = uuid.uuid4().hex
+            reset_tokens.insert_one(
+                {"userId": user["_id"], "token": token, "expiresAt": datetime.utcnow() + timedelta(hours=1), "createdAt": datetime.utcnow()}
+            )
+
+            if not APP_BASE_URL:
+                reset_link = url_for("reset_password", token=token, _external=True)
+            else:
+                reset_link = f"{APP_BASE_URL.rstrip('/')}{url_for('reset_password', token=token)}"
+
+            try:
+                send_email(
+                    to_email=email,
+                    subject="Reset your ABTO password",
+                    body_text=(
+                        "We received a request to reset your password.\n\n"
+                        f"Reset link (valid for 1 hour):\n{reset_link}\n\n"
+                        "If you did not request this, you can ignore this email."
+                    ),
+                )
+            except Exception as e:
+                logger.error("Password reset email failed: %s", e)
+
+        return redirect(url_for("login"))
+
+    return render_template("forgot_password.html")
+
+
+@app.route("/reset-password/<token>", methods=["GET", "POST"])
+def reset_password(token):
+    rec = reset_tokens.find_one({"token": token}, {"userId": 1, "expiresAt": 1})
+    if not rec or rec.get("expiresAt") < datetime.utcnow():
+        flash("Reset link is invalid or expired.", "error")
+        return redirect(url_for("login"))
+
+    if request.method == "POST":
+        new_pw = request.form["password"]
+
+        users_collection.update_one(
+            {"_id": rec["userId"]},
+            {"$set": {"passwordHash": generate_password_hash(new_pw, method=PASSWORD_HASH_METHOD)}},
+        )
+        invalidate_user_cache(rec["userId"])
+        reset_tokens.delete_one({"_id": rec["_id"]})
+
+        flash("Password updated. You can log in now.", "success")
+        return redirect(url_for("login"))
+
+    return render_template("reset_password.html")
+
+
+# --------------------------------------------------------
+# Upload Route (CREATE with ownerId) - size hardened
+# --------------------------------------------------------
+@app.route("/upload", methods=["GET", "POST"])
+def upload():
+    user = current_user()
+    if not user:
+        session["next"] = request.path
+        return redirect(url_for("login"))
+
+    owner_oid = ObjectId(user["_id"])
+
+    if request.method == "POST":
+        street_type = request.form.get("street_type")
+
+        # One aware timestamp for the whole insert (datetime.utcnow() is
+        # deprecated and naive); createdAt/updatedAt stay identical.
+        now = datetime.now(timezone.utc)
+
+        mode = request.form.get("mode")
+        name = clean_text(request.form.get("name"), 100)
+        city = clean_text(request.form.get("city"), 50)
+        country = clean_text(request.form.get("country"), 50)
+
+        try:
+            lat = float(request.form.get("lat"))
+            lng = float(request.form.get("lng"))
+        except Exception:
+            flash("Invalid latitude/longitude", "error")
+            return redirect(url_for("upload"))
+
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            flash("Latitude/longitude out of range", "error")
+            return redirect(url_for("upload"))
+
+        category = clean_text(request.form.get("category"), 80)
+        description = clean_text(request.form.get("description"), 500)
+
+        # ---------------- VIDEO ----------------
+        if street_type == "video":
+            if mode not in ["walk", "drive", "fly", "sit"]:
+                mode = "walk"
+
+            is_tour_flag = request.form.get("is_tour")
+            is_tour = True if is_tour_flag in ("on", "true", "1") else False
+            tour_category = clean_text(request.form.get("tour_category"), 80)
+            tour_best_time = clean_text(request.form.get("tour_best_time"), 80)
+
+            # ✅ NEW: Thumbnail (optional)
+            thumbnail_url = None
+            thumb_file = request.files.get("thumbnail")
+            if thumb_file and thumb_file.filename:
+                if not allowed_thumb(thumb_file.filename):
+                    flash("Thumbnail must be JPG / PNG / WEBP.", "error")
+                    return redirect(url_for("upload"))
+
+                if exceeds_limit(thumb_file, MAX_THUMB_SIZE):
+                    flash(f"Thumbnail must be under {MAX_THUMB_SIZE // (1024*1024)}MB", "error")
+                    return redirect(url_for("upload"))
+
+                try:
+                    thumbnail_url = upload_image_cloudinary(thumb_file)
+                except Exception as e:
+                    flash("Thumbnail upload failed.", "error")
+                    logger.error("Thumbnail upload failed: %s", e)
+                    return redirect(url_for("upload"))
+
+            files = [f for f in request.files.getlist("video") if f and f.filename]
+            links_raw = request.form.get("video_links")
+
+            video_urls = []
+
+            # Validate all sizes up front so nothing is uploaded if any file
+            # is oversized.
+            for file in files:
+                if exceeds_limit(file, MAX_VIDEO_SIZE):
+                    flash(f"Each video must be under {MAX_VIDEO_SIZE // (1024*1024)}MB", "error")
+                    return redirect(url_for("upload"))
+
+            # The uploads are network-bound, so overlap them: wall-clock time
+            # drops from the sum of the transfers to roughly the largest one.
+            # ex.map preserves the part ordering.
+            if files:
+                try:
+                    workers = min(int(os.getenv("UPLOAD_WORKERS", "8")), len(files))
+                    with ThreadPoolExecutor(max_workers=workers) as ex:
+                        video_urls = list(ex.map(upload_video_cloudinary, files))
+                except Exception as e:
+                    flash("Video upload failed.", "error")
+                    logger.error("Video upload failed: %s", e)
+                    return redirect(url_for("upload"))
+
+            if links_raw:
+                video_urls.extend(
+                    u for u in (s.strip() for s in _LINK_SPLIT.split(links_raw)) if u
+                )
+
+            if not video_urls:
+                flash("Upload one or more videos or paste links!", "error")
+                return redirect(url_for("upload"))
+
+            street_doc = {
+                "ownerId": owner_oid,
+                "type": "video",
+                "mode": mode,
+                "category": category,
+                "name": name,
+                "city": city,
+                "country": country,
+                "lat": lat,
+                "lng": lng,
+                "loc": geo_point(lat, lng),
+                "description": description,
+                "videos": [{"url": url, "title": f"Part {i + 1}"} for i, url in enumerate(video_urls)],
+                "thumbnail_url": thumbnail_url,  # ✅ NEW FIELD
+                "likes": 0,
+                "createdAt": now,
+                "updatedAt": now,
+                "status": "published",
+                "deleted": False,
+                "is_tour": is_tour,
+                "tour_category": tour_category,
+                "tour_best_time": tour_best_time,
+            }
+
+        # ---------------- 3D ----------------
+        elif street_type == "3d":
+            file = request.files.get("model")
+            link = request.form.get("model_link")
+
+            glb_url = None
+
+            if file and file.filename:
+                if exceeds_limit(file, MAX_GLB_SIZE):
+                    flash(f"GLB file must be under {MAX_GLB_SIZE // (1024*1024)}MB", "error")
+                    return redirect(url_for("upload"))
+
+                try:
+                    glb_url = upload_glb_supabase(file)
+                except Exception as e:
+                    flash("GLB upload failed.", "error")
+                    logger.error("GLB upload failed: %s", e)
+                    return redirect(url_for("upload"))
+
+            elif link:
+                glb_url = link.strip()
+            else:
+                flash("Upload a GLB or paste a model URL", "error")
+                return redirect(url_for("upload"))
+
+            street_doc = {
+                "ownerId": owner_oid,
+                "type": "3d",
+                "name": name,
+                "city": city,
+                "country": country,
+                "description": description,
+                "lat": lat,
+                "lng": lng,
+                "loc": geo_point(lat, lng),
+                "glbUrl": glb_url,
+                "likes": 0,
+                "createdAt": now,
+                "updatedAt": now,
+                "status": "published",
+                "deleted": False,
+            }
+
+        else:
+            flash("Invalid street type!", "error")
+            return redirect(url_for("upload"))
+
+        streets_collection.insert_one(street_doc)
+        bump_streets_version()
+        if street_doc.get("type") == "video":
+            invalidate_category_cache(street_doc.get("mode"))
+        flash("Street added successfully!", "success")
+        return redirect(url_for("dashboard"))
+
+    return render_template("upload.html")
+
+
+
+# --------------------------------------------------------
+# Dashboard Page (READ only your streets by default)
+# --------------------------------------------------------
+@app.route("/dashboard")
+def dashboard():
+    user = current_user()
+    if not user:
+        session["next"] = request.path
+        return redirect(url_for("login"))
+
+    query = {"deleted": False}
+    if not is_admin_user(user):
+        query["ownerId"] = ObjectId(user["_id"])
+
+    # One server-side pipeline instead of materializing every street in
+    # Python: per-(type, mode) counts with like totals, plus the 8 newest
+    # docs sorted by the createdAt index. ~10 aggregate rows come back
+    # regardless of collection size.
+    facet = list(
+        streets_collection.aggregate(
+            [
+                {"$match": query},
+                {
+                    "$facet": {
+                        "counts": [
+                            {
+                                "$group": {
+                                    "_id": {"type": "$type", "mode": "$mode"},
+                                    "n": {"$sum": 1},
+                                    "likes": {"$sum": "$likes"},
+                                }
+                            }
+                        ],
+                        "recent": [
+                            {"$sort": {"createdAt": -1}},
+                            {"$limit": 8},
+                            {
+                                "$project": {
+                                    "name": 1,
+                                    "city": 1,
+                                    "country": 1,
+                                    "type": 1,
+                                    "mode": 1,
+                                    "likes": 1,
+                                    "createdAt": 1,
+                                }
+                            },
+                        ],
+                    }
+                },
+            ]
+        )
+    )
+    counts = facet[0]["counts"] if facet else []
+    recent_streets = [make_json_safe(s) for s in (facet[0]["recent"] if facet else [])]
+
+    for s in recent_streets:
+        s["createdAtFmt"] = format_date(s.get("createdAt"))
+
+    total_streets = sum(c["n"] for c in counts)
+    total_likes = sum(int(c.get("likes") or 0) for c in counts)
+
+    mode_counts = {}
+    for c in counts:
+        key = c.get("_id") or {}
+        if key.get("type") == "video":
+            mode_counts[key.get("mode")] = c["n"]
+
+    walk_count = mode_counts.get("walk", 0)
+    drive_count = mode_counts.get("drive", 0)
+    fly_count = mode_counts.get("fly", 0)
+    sit_count = mode_counts.get("sit", 0)
+
+    user_info = {
+        "name": user.get("name") or user.get("email", "User"),
+        "email": user.get("email", ""),
+        "createdAtFmt": format_date(user.get("createdAt")),
+        "lastLoginFmt": format_date(user.get("lastLoginAt")),
+        "role": user.get("role", "user"),
+        "is_admin": bool(is_admin_user(user)),
+    }
+
+    return render_template(
+        "dash.html",
+        streets=recent_streets,
+        total_streets=total_streets,
+        total_likes=total_likes,
+        walk_count=walk_count,
+        drive_count=drive_count,
+        fly_count=fly_count,
+        sit_count=sit_count,
+        recent_streets=recent_streets,
+        user_info=user_info,
+    )
+
+
+# --------------------------------------------------------
+# ✅ ADMIN PAGES
+# --------------------------------------------------------
+@app.route("/admin")
+@admin_required
+def admin_dashboard():
+    total_users = users_collection.count_documents({})
+    total_streets = streets_collection.count_documents({"deleted": False})
+    total_deleted = streets_collection.count_documents({"deleted": True})
+
+    recent_logs = list(activity_logs.find({}).sort("timestamp", -1).limit(25))
+    recent_logs = make_json_safe(recent_logs)
+
+    return render_template(
+        "admin/dashboard.html",
+        total_users=total_users,
+        total_streets=total_streets,
+        total_deleted=total_deleted,
+        recent_logs=recent_logs,
+    )
+
+
+@app.route("/admin/users")
+@admin_required
+def admin_users():
+    users = list(users_collection.find({}).sort("createdAt", -1).limit(200))
+    users = make_json_safe(users)
+    return render_template("admin/users.html", users=users)
+
+
+@app.route("/admin/streets")
+@admin_required
+def admin_streets():
+    streets = list(streets_collection.find({}).sort("createdAt", -1).limit(300))
+    streets = make_json_safe(streets)
+    return render_template("admin/streets.html", streets=streets)
+
+
+@app.post("/admin/user/<user_id>/make-admin")
+@admin_required
+def admin_make_user_admin(user_id):
+    try:
+        oid = ObjectId(user_id)
+    except InvalidId:
+        abort(404)
+
+    users_collection.update_one({"_id": oid}, {"$set": {"role": "admin"}})
+    invalidate_user_cache(oid)
+    flash("User promoted to admin.", "success")
+    return redirect(url_for("admin_users"))
+
+
+@app.post("/admin/user/<user_id>/make-user")
+@admin_required
+def admin_make_admin_user_normal(user_id):
+    try:
+        oid = ObjectId(user_id)
+    except InvalidId:
+        abort(404)
+
+    users_collection.update_one({"_id": oid}, {"$set": {"role": "user"}})
+    invalidate_user_cache(oid)
+    flash("Admin changed to user.", "info")
+    return redirect(url_for("admin_users"))
+
+
+# --------------------------------------------------------
+# Edit Street (UPDATE – only owner or admin)
+# --------------------------------------------------------
+@app.route("/street/<street_id>/edit", methods=["GET", "POST"])
+def edit_street(street_id):
+    user = current_user()
+    if not user:
+        session["next"] = request.path
+        return redirect(url_for("login"))
+
+    try:
+        oid = ObjectId(street_id)
+    except InvalidId:
+        abort(404)
+
+    query = {"_id": oid, "deleted": False}
+    if not is_admin_user(user):
+        query["ownerId"] = ObjectId(user["_id"])
+
+    street = streets_collection.find_one(query)
+    if not street:
+        abort(404)
+
+    if request.method == "POST":
+        updated_fields = {
+            "name": clean_text(request.form.get("name"), 100),
+            "city": clean_text(request.form.get("city"), 50),
+            "country": clean_text(request.form.get("country"), 50),
+            "category": clean_text(request.form.get("category"), 80),
+            "description": clean_text(request.form.get("description"), 500),
+        }
+
+        if "is_tour" in request.form:
+            is_tour_flag = request.form.get("is_tour")
+            updated_fields["is_tour"] = True if is_tour_flag in ("on", "true", "1") else False
+        if "tour_category" in request.form:
+            updated_fields["tour_category"] = clean_text(request.form.get("tour_category"), 80)
+        if "tour_best_time" in request.form:
+            updated_fields["tour_best_time"] = clean_text(request.form.get("tour_best_time"), 80)
+
+        try:
+            lat = float(request.form.get("lat"))
+            lng = float(request.form.get("lng"))
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                raise ValueError
+            updated_fields["lat"] = lat
+            updated_fields["lng"] = lng
+            updated_fields["loc"] = geo_point(lat, lng)
+        except Exception:
+            flash("Invalid latitude/longitude", "error")
+            return redirect(url_for("edit_street", street_id=street_id))
+
+        updated_fields["updatedAt"] = datetime.utcnow()
+        streets_collection.update_one({"_id": oid}, {"$set": updated_fields})
+        bump_streets_version()
+        # The edit may have renamed this street's category.
+        invalidate_category_cache(street.get("mode"))
+        flash("Street updated successfully.", "success")
+        return redirect(url_for("dashboard"))
+
+    street["_id"] = str(street["_id"])
+    return render_template("edit_street.html", street=street)
+
+
+# --------------------------------------------------------
+# Delete Street (DELETE – only owner or admin, soft delete)
+# --------------------------------------------------------
+@app.route("/street/<street_id>/delete", methods=["POST"])
+def delete_street(street_id):
+    user = current_user()
+    if not user:
+        session["next"] = request.path
+        return redirect(url_for("login"))
+
+    try:
+        oid = ObjectId(street_id)
+    except InvalidId:
+        abort(404)
+
+    query = {"_id": oid, "deleted": False}
+    if not is_admin_user(user):
+        query["ownerId"] = ObjectId(user["_id"])
+
+    now = datetime.utcnow()
+    result = streets_collection.update_one(
+        query,
+        {"$set": {"deleted": True, "deletedAt": now, "updatedAt": now}}
+    )
+
+    if result.matched_count == 0:
+        abort(404)
+
+    bump_streets_version()
+    # Deleting the last street of a category should drop it from the pills.
+    invalidate_category_cache()
+    flash("Street deleted.", "info")
+    return redirect(url_for("dashboard"))
+
+
+# --------------------------------------------------------
+# Streets in current map view  (/api/streets_in_view)
+# --------------------------------------------------------
+@app.route("/api/streets_in_view")
+def api_streets_in_view():
+    """
+    Pins inside a map viewport: ?west=&south=&east=&north= (degrees).
+    Served by the 2dsphere index on loc, so it stays logarithmic no matter
+    how many streets exist.
+    """
+    try:
+        west = float(request.args["west"])
+        south = float(request.args["south"])
+        east = float(request.args["east"])
+        north = float(request.args["north"])
+    except (KeyError, ValueError):
+        return {"error": "west, south, east and north are required numbers."}, 400
+
+    box = {
+        "type": "Polygon",
+        "coordinates": [[
+            [west, south], [east, south], [east, north], [west, north], [west, south]
+        ]],
+    }
+    streets = list(
+        streets_json.find(
+            published_not_deleted({"loc": {"$geoWithin": {"$geometry": box}}}),
+            LIST_PROJECTION,
+        ).limit(int(os.getenv("VIEWPORT_RESULT_LIMIT", "500")))
+    )
+    return {"streets": streets}
+
+
+# --------------------------------------------------------
+# Trip Price API  (/api/price)
+# --------------------------------------------------------
+@app.route("/api/price", methods=["POST"])
+def api_price():
+    payload = request.get_json(silent=True) or {}
+
+    origin = clean_text(payload.get("origin") or payload.get("from"), 100)
+    destination = clean_text(payload.get("destination") or payload.get("to"), 100)
+
+    if not origin or not destination:
+        return {"error": "Please enter both origin and destination."}, 400
+
+    try:
+        geo_from = geocode_place(origin)
+        geo_to = geocode_place(destination)
+    except Exception:
+        logger.exception("api_price: geocoding failed")
+        return {"error": "Could not reach the distance service. Please try again in a moment."}, 502
+
+    if not geo_from or not geo_to:
+        return {"error": "We couldn't find one of those places. Try using a nearby big city or airport."}, 404
+
+    distance_km = haversine_km(geo_from["lat"], geo_from["lng"], geo_to["lat"], geo_to["lng"])
+
+    price_info = estimate_price_aed(distance_km)
+    distance_text, price_text = build_price_texts(distance_km, price_info)
+
+    return {
+        "origin_formatted": geo_from.get("display_name", origin),
+        "destination_formatted": geo_to.get("display_name", destination),
+        "distance_km": round(distance_km, 1),
+        "distance_text": distance_text,
+        "price_text": price_text,
+    }
+
+
+# --------------------------------------------------------
+# Activity Logging API
+# --------------------------------------------------------
+# Activity events are fire-and-forget telemetry, so they are batched: the
+# route drops the doc on an in-process queue and a daemon thread drains up to
+# ACTIVITY_FLUSH_BATCH docs (or whatever arrived within
+# ACTIVITY_FLUSH_INTERVAL seconds) into one insert_many, amortizing the write
+# round-trip and journal sync across many events. The thread starts lazily on
+# first use so each gunicorn worker gets its own after the fork.
+ACTIVITY_FLUSH_BATCH = int(os.getenv("ACTIVITY_FLUSH_BATCH", "500"))
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "1.0"))
+_activity_queue = queue.Queue()
+_activity_flusher_started = False
+_activity_flusher_lock = threading.Lock()
+
+
+def _activity_flusher():
+    while True:
+        batch = [_activity_queue.get()]
+        deadline = time.monotonic() + ACTIVITY_FLUSH_INTERVAL
+        while len(batch) < ACTIVITY_FLUSH_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_activity_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            activity_logs.insert_many(batch, ordered=False)
+        except Exception:
+            logger.exception("Activity log flush failed; %s events dropped", len(batch))
+
+
+def queue_activity(log_doc):
+    global _activity_flusher_started
+    if not _activity_flusher_started:
+        with _activity_flusher_lock:
+            if not _activity_flusher_started:
+                threading.Thread(
+                    target=_activity_flusher, name="activity-flusher", daemon=True
+                ).start()
+                _activity_flusher_started = True
+    _activity_queue.put(log_doc)
+
+
+@app.route("/api/activity", methods=["POST"])
+def log_activity():
+    user = current_user()
+    if not user:
+        return ("", 204)
+
+    data = request.get_json(silent=True) or {}
+    event_type = clean_text(data.get("event_type"), 50)
+    street_id = data.get("street_id")
+    mode = clean_text(data.get("mode"), 10)
+    extra = data.get("extra") if isinstance(data.get("extra"), dict) else {}
+
+    try:
+        street_oid = ObjectId(street_id) if street_id else None
+    except InvalidId:
+        street_oid = None
+
+    log_doc = {
+        "userId": ObjectId(user["_id"]),
+        "streetId": street_oid,
+        "eventType": event_type,
+        "mode": mode,
+        "timestamp": datetime.utcnow(),
+        "userAgent": request.headers.get("User-Agent", "")[:200],
+        "extra": extra,
+    }
+    queue_activity(log_doc)
+    return ("", 204)
+
+
+@app.get("/api/dashboard/summary")
+def api_dashboard_summary():
+    user = current_user()
+    if not user:
+        return {"error": "Unauthorized"}, 401
+
+    days = int(request.args.get("days", "30"))
+    since = start_date_for_range(days)
+
+    query_streets = {"deleted": False}
+    if not is_admin_user(user):
+        query_streets["ownerId"] = ObjectId(user["_id"])
+
+    streets = list(streets_collection.find(query_streets, {
+        "name": 1, "city": 1, "country": 1, "type": 1, "mode": 1, "likes": 1,
+        "createdAt": 1, "lat": 1, "lng": 1, "status": 1
+    }))
+
+    # One pass over the streets builds the JSON-safe list, the id lookup map
+    # and every counter the old code re-scanned the list five times for.
+    mode_counts = Counter()
+    total_likes = 0
+    street_map = {}
+    streets_safe = []
+    for s in streets:
+        likes = int(s.get("likes", 0) or 0)
+        total_likes += likes
+        if s.get("type") == "video":
+            mode_counts[s.get("mode")] += 1
+        sid = str(s["_id"])
+        street_map[sid] = s
+        streets_safe.append({
+            "_id": sid,
+            "name": s.get("name") or "Untitled",
+            "city": s.get("city") or "",
+            "country": s.get("country") or "",
+            "type": s.get("type"),
+            "mode": s.get("mode"),
+            "likes": likes,
+            "createdAt": to_iso(s.get("createdAt")),
+            "lat": s.get("lat"),
+            "lng": s.get("lng"),
+            "status": s.get("status", ""),
+        })
+
+    totals = {
+        "total_streets": len(streets),
+        "total_likes": total_likes,
+        "walk_count": mode_counts["walk"],
+        "drive_count": mode_counts["drive"],
+        "fly_count": mode_counts["fly"],
+        "sit_count": mode_counts["sit"],
+        "is_admin": bool(is_admin_user(user)),
+    }
+
+    logs_query = {}
+    if not is_admin_user(user):
+        logs_query["userId"] = ObjectId(user["_id"])
+    if since:
+        logs_query["timestamp"] = {"$gte": since}
+
+    events = list(activity_logs.find(logs_query, {
+        "eventType": 1, "streetId": 1, "mode": 1, "timestamp": 1
+    }).sort("timestamp", -1).limit(500))
+
+    view_types = set(["view_world", "open_world", "view_street", "open_street"])
+    def is_view_event(e):
+        et = (e.get("eventType") or "").lower()
+        return et in view_types or et.startswith("view") or et.startswith("open")
+
+    # Likewise one pass over the events: is_view_event runs once per event
+    # and feeds both the per-day and per-street tallies.
+    day_counts = Counter()
+    view_by_street = Counter()
+    for e in events:
+        if not is_view_event(e):
+            continue
+        ts = e.get("timestamp")
+        if ts:
+            day_counts[ts.strftime("%Y-%m-%d")] += 1
+        sid = e.get("streetId")
+        if sid:
+            view_by_street[str(sid)] += 1
+
+    top_views = view_by_street.most_common(8)
+    top_views_list = []
+    for sid, c in top_views:
+        st = street_map.get(sid, {})
+        top_views_list.append({
+            "streetId": sid,
+            "views": c,
+            "name": st.get("name", "Unknown"),
+            "mode": st.get("mode"),
+            "city": st.get("city"),
+            "country": st.get("country"),
+        })
+
+    top_likes_list = heapq.nlargest(8, streets_safe, key=lambda x: x["likes"])
+
+    recent = []
+    for e in events[:25]:
+        sid = str(e.get("streetId")) if e.get("streetId") else None
+        st = street_map.get(sid, {})
+        recent.append({
+            "eventType": e.get("eventType"),
+            "mode": e.get("mode") or st.get("mode"),
+            "timestamp": to_iso(e.get("timestamp")),
+            "streetId": sid,
+            "streetName": st.get("name"),
+            "city": st.get("city"),
+            "country": st.get("country"),
+        })
+
+    labels, data = [], []
+    if since:
+        for i in range(days - 1, -1, -1):
+            d = (datetime.utcnow() - timedelta(days=i)).strftime("%Y-%m-%d")
+            labels.append(d)
+            data.append(day_counts.get(d, 0))
+    else:
+        for d in sorted(day_counts.keys()):
+            labels.append(d)
+            data.append(day_counts[d])
+
+    return {
+        "totals": totals,
+        "views_chart": {"labels": labels, "data": data},
+        "recent": recent,
+        "top_views": top_views_list,
+        "top_likes": top_likes_list,
+        "streets": streets_safe,
+        "user": {
+            "name": user.get("name") or user.get("email", "User"),
+            "email": user.get("email", ""),
+            "role": user.get("role", "user"),
+            "is_admin": bool(is_admin_user(user)),
+            "createdAt": to_iso(user.get("createdAt")),
+            "lastLoginAt": to_iso(user.get("lastLoginAt")),
+        }
+    }
+
+
+# --------------------------------------------------------
+# Like Endpoint
+# --------------------------------------------------------
+# The liked list lives in the signed session cookie, which travels on every
+# request — cap it as a ring buffer so the cookie can't grow unboundedly.
+LIKED_SESSION_CAP = int(os.getenv("LIKED_SESSION_CAP", "256"))
+
+
+@app.post("/like/<street_id>")
+def like_street(street_id):
+    oid = _oid(street_id)
+    if oid is None:
+        return {"error": "Invalid ID"}, 400
+
+    uid = session.get("user_id")
+    if uid:
+        # Signed-in likes live in their own collection; the unique
+        # (userId, streetId) index makes repeats idempotent instead of the
+        # cookie list, which capped out and forgot old likes.
+        try:
+            likes_collection.insert_one({"userId": ObjectId(uid), "streetId": oid})
+        except DuplicateKeyError:
+            street = streets_collection.find_one({"_id": oid}, {"likes": 1})
+            return {"likes": street.get("likes", 0) if street else 0}
+    else:
+        # Anonymous users keep the rolling session list.
+        liked = session.get("liked", [])
+        if street_id in liked:
+            street = streets_collection.find_one({"_id": oid}, {"likes": 1})
+            return {"likes": street.get("likes", 0) if street else 0}
+        liked.append(street_id)
+        session["liked"] = liked[-LIKED_SESSION_CAP:]
+
+    # Increment and read back the new count in one round-trip.
+    street = streets_collection.find_one_and_update(
+        {"_id": oid},
+        {"$inc": {"likes": 1}},
+        projection={"likes": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+
+    return {"likes": street.get("likes", 0) if street else 0}
+
+
+# --------------------------------------------------------
+# Start Server (production ready)
+# --------------------------------------------------------
+if __name__ == "__main__":
+    debug = os.getenv("FLASK_DEBUG", "0") == "1"
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=debug)
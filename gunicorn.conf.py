@@ -0,0 +1,18 @@
+import multiprocessing
+import os
+
+# All request handlers are I/O-bound (MongoDB, Cloudinary, Supabase,
+# Nominatim), so threaded workers multiply concurrency: the GIL is released
+# while sockets are waiting. gevent is avoided on purpose — pymongo's
+# monkey-patch interplay is fragile — gthread gives most of the win safely.
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# Large video uploads can legitimately take minutes.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+
+# Keep preload off: MongoClient must be created after the worker fork so each
+# worker owns its own connection pool.
+preload_app = False